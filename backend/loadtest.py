@@ -0,0 +1,369 @@
+"""Load generator for the TaskFlow API.
+
+Simulated users register, log in and hit the task routes concurrently, each
+request picked from a weighted mix. Latencies are reported per route template.
+
+Usage:
+    python loadtest.py                                   # in-process, STORAGE_BACKEND=memory
+    python loadtest.py --url http://127.0.0.1:8000       # any running server
+    python loadtest.py --concurrency 50 --duration 60 --mix list=50,get=30,update=20
+    python loadtest.py --save baselines/inprocess-memory.json   # record a baseline
+    python loadtest.py --baseline baselines/inprocess-memory.json --tolerance 0.25
+                                                         # exit 1 on regression,
+                                                         # 2 if the config differs
+
+In-process runs drive the ASGI app through httpx without a socket. They use
+the memory storage backend unless STORAGE_BACKEND says otherwise, and relax
+the login rate limits, which would otherwise reject most of the traffic.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+# Each operation is the VirtualUser method of the same name
+OPERATIONS = ("list", "get", "create", "update", "delete", "search", "stats", "login", "register")
+DEFAULT_MIX = "list=30,get=15,create=15,update=15,search=10,stats=5,delete=5,login=3,register=2"
+
+SEARCH_WORDS = ("report", "review", "deploy", "invoice", "meeting", "refactor", "design", "budget")
+STATUSES = ("pending", "in-progress", "completed")
+PRIORITIES = ("low", "medium", "high")
+
+# Runs that differ in any of these are not comparable; the seed only picks the requests
+COMPARED_CONFIG = ("target", "concurrency", "users", "duration", "mix", "tasks_per_user")
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"unknown operation {name!r}; expected one of {', '.join(OPERATIONS)}")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(1, round(fraction * len(ordered) + 0.5))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def task_payload(rng: random.Random) -> dict:
+    words = rng.sample(SEARCH_WORDS, 2)
+    return {
+        "title": f"{words[0].title()} {words[1]} {rng.randrange(10_000)}",
+        "description": f"Load test task about {words[0]} and {words[1]}",
+        "status": rng.choice(STATUSES),
+        "priority": rng.choice(PRIORITIES),
+    }
+
+
+class Recorder:
+    """Latencies and failures per endpoint label."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[int, int]] = {}
+
+    def record(self, endpoint: str, seconds: float, status_code: int, ok: bool) -> None:
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        codes = self.statuses.setdefault(endpoint, {})
+        codes[status_code] = codes.get(status_code, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        def stats(latencies: List[float], errors: int) -> dict:
+            ordered = sorted(latencies)
+            return {
+                "count": len(ordered),
+                "errors": errors,
+                "throughput": len(ordered) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(ordered, 0.50) * 1000,
+                "p95_ms": percentile(ordered, 0.95) * 1000,
+                "p99_ms": percentile(ordered, 0.99) * 1000,
+            }
+
+        endpoints = {
+            endpoint: {**stats(latencies, self.errors.get(endpoint, 0)), "statuses": self.statuses[endpoint]}
+            for endpoint, latencies in sorted(self.latencies.items())
+        }
+        everything = [seconds for latencies in self.latencies.values() for seconds in latencies]
+        return {
+            "elapsed_seconds": elapsed,
+            "endpoints": endpoints,
+            "total": stats(everything, sum(self.errors.values())),
+        }
+
+
+class VirtualUser:
+    """One account and the task ids it knows about; runs operations in a loop."""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, rng: random.Random, email: str, password: str):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.email = email
+        self.password = password
+        self.token: Optional[str] = None
+        self.task_ids: List[str] = []
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    async def request(self, endpoint: str, method: str, path: str, expect=(200,), **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(endpoint, time.perf_counter() - started, 0, ok=False)
+            return None
+        ok = response.status_code in expect
+        self.recorder.record(endpoint, time.perf_counter() - started, response.status_code, ok)
+        return response if ok else None
+
+    async def register(self) -> None:
+        email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+        await self.request(
+            "POST /api/auth/register", "POST", "/api/auth/register",
+            json={"name": "Load Test", "email": email, "password": self.password},
+        )
+
+    async def login(self) -> None:
+        response = await self.request(
+            "POST /api/auth/login", "POST", "/api/auth/login",
+            json={"email": self.email, "password": self.password},
+        )
+        if response is not None:
+            self.token = response.json()["access_token"]
+
+    async def list(self) -> None:
+        await self.request(
+            "GET /api/tasks", "GET", "/api/tasks", params={"limit": 50}, headers=self.headers,
+        )
+
+    async def search(self) -> None:
+        await self.request(
+            "GET /api/tasks?search", "GET", "/api/tasks",
+            params={"search": self.rng.choice(SEARCH_WORDS)[:4], "limit": 50}, headers=self.headers,
+        )
+
+    async def stats(self) -> None:
+        await self.request("GET /api/tasks/stats", "GET", "/api/tasks/stats", headers=self.headers)
+
+    async def create(self) -> None:
+        response = await self.request(
+            "POST /api/tasks", "POST", "/api/tasks", json=task_payload(self.rng), headers=self.headers,
+        )
+        if response is not None:
+            self.task_ids.append(response.json()["id"])
+
+    async def get(self) -> None:
+        if not self.task_ids:
+            return await self.create()
+        await self.request(
+            "GET /api/tasks/{task_id}", "GET", f"/api/tasks/{self.rng.choice(self.task_ids)}", headers=self.headers,
+        )
+
+    async def update(self) -> None:
+        if not self.task_ids:
+            return await self.create()
+        await self.request(
+            "PUT /api/tasks/{task_id}", "PUT", f"/api/tasks/{self.rng.choice(self.task_ids)}",
+            json={"status": self.rng.choice(STATUSES), "priority": self.rng.choice(PRIORITIES)},
+            headers=self.headers,
+        )
+
+    async def delete(self) -> None:
+        if not self.task_ids:
+            return await self.create()
+        task_id = self.task_ids.pop(self.rng.randrange(len(self.task_ids)))
+        await self.request("DELETE /api/tasks/{task_id}", "DELETE", f"/api/tasks/{task_id}", headers=self.headers)
+
+    async def run(self, mix: Dict[str, int], deadline: float) -> None:
+        names, weights = list(mix), list(mix.values())
+        while time.perf_counter() < deadline:
+            await getattr(self, self.rng.choices(names, weights)[0])()
+
+
+async def set_up_user(client: httpx.AsyncClient, rng: random.Random, tasks_per_user: int) -> VirtualUser:
+    """Register an account and seed its tasks; none of this is measured."""
+    user = VirtualUser(client, Recorder(), rng, f"load-{uuid.uuid4().hex[:12]}@example.com", "load-test-pw")
+    response = await client.post(
+        "/api/auth/register", json={"name": "Load Test", "email": user.email, "password": user.password},
+    )
+    response.raise_for_status()
+    user.token = response.json()["access_token"]
+    if tasks_per_user:
+        response = await client.post(
+            "/api/tasks/bulk",
+            json={"tasks": [task_payload(rng) for _ in range(tasks_per_user)]},
+            headers=user.headers,
+        )
+        response.raise_for_status()
+        user.task_ids = [result["id"] for result in response.json()["results"] if result["status"] == "created"]
+    return user
+
+
+async def run_load(client: httpx.AsyncClient, args) -> dict:
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    # Registration pays for a bcrypt hash, so accounts are created a few at a time
+    setup_slots = asyncio.Semaphore(8)
+
+    async def set_up(index):
+        async with setup_slots:
+            return await set_up_user(client, random.Random(rng.random()), args.tasks_per_user)
+
+    users = await asyncio.gather(*(set_up(i) for i in range(args.users or args.concurrency)))
+
+    recorder = Recorder()
+    workers = []
+    for index in range(args.concurrency):
+        account = users[index % len(users)]
+        worker = VirtualUser(client, recorder, random.Random(rng.random()), account.email, account.password)
+        worker.token = account.token
+        # Workers sharing an account split its tasks, so none deletes a task another still reads
+        sharing = len(range(index % len(users), args.concurrency, len(users)))
+        worker.task_ids = account.task_ids[index // len(users)::sharing]
+        workers.append(worker)
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(worker.run(mix, deadline) for worker in workers))
+    summary = recorder.summary(time.perf_counter() - started)
+    summary["config"] = {
+        "target": args.url or f"in-process ({os.environ.get('STORAGE_BACKEND')})",
+        "concurrency": args.concurrency,
+        "users": len(users),
+        "duration": args.duration,
+        "mix": mix,
+        "tasks_per_user": args.tasks_per_user,
+        "seed": args.seed,
+    }
+    return summary
+
+
+async def run_in_process(args) -> dict:
+    os.environ.setdefault("STORAGE_BACKEND", "memory")
+    # Every virtual user logs in from the same address
+    for name in ("LOGIN_RATE_PER_IP_PER_MINUTE", "LOGIN_BURST_PER_IP", "LOGIN_RATE_PER_EMAIL_PER_MINUTE",
+                 "LOGIN_BURST_PER_EMAIL"):
+        os.environ.setdefault(name, "1000000")
+    sys.path.insert(0, str(Path(__file__).parent))
+    import server
+
+    # httpx logs every request at INFO, which would swamp the summary
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.app.router.lifespan_context(server.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+            return await run_load(client, args)
+
+
+async def run_remote(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        return await run_load(client, args)
+
+
+def print_summary(summary: dict) -> None:
+    print(f"{'endpoint':<28} {'count':>7} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    rows = [*summary["endpoints"].items(), ("TOTAL", summary["total"])]
+    for endpoint, stats in rows:
+        print(
+            f"{endpoint:<28} {stats['count']:>7} {stats['errors']:>6} {stats['throughput']:>8.1f} "
+            f"{stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f}"
+        )
+
+
+class ConfigMismatch(Exception):
+    """The run and the baseline were not made with the same load."""
+
+
+def compare_to_baseline(summary: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Endpoints whose p95/p99 grew, or whose throughput or error rate got worse, beyond ``tolerance``.
+
+    Raises ConfigMismatch when the run's config differs from the baseline's.
+    """
+    mismatches = [
+        f"{key}: baseline {baseline['config'].get(key)!r}, this run {summary['config'].get(key)!r}"
+        for key in COMPARED_CONFIG
+        if baseline["config"].get(key) != summary["config"].get(key)
+    ]
+    if mismatches:
+        raise ConfigMismatch(mismatches)
+
+    regressions = []
+    for endpoint, before in [*baseline["endpoints"].items(), ("TOTAL", baseline["total"])]:
+        after = summary["total"] if endpoint == "TOTAL" else summary["endpoints"].get(endpoint)
+        if after is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if after[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{endpoint}: {key} {before[key]:.2f} -> {after[key]:.2f}")
+        if after["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{endpoint}: req/s {before['throughput']:.1f} -> {after['throughput']:.1f}")
+        error_rate = after["errors"] / after["count"] if after["count"] else 0.0
+        baseline_rate = before["errors"] / before["count"] if before["count"] else 0.0
+        if error_rate > baseline_rate + tolerance / 10:
+            regressions.append(f"{endpoint}: error rate {baseline_rate:.1%} -> {error_rate:.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TaskFlow API load generator")
+    parser.add_argument("--url", help="server to load, e.g. http://127.0.0.1:8000 (default: in-process)")
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users running at once")
+    parser.add_argument("--users", type=int, help="accounts shared by the virtual users (default: one each)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of measured load")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--tasks-per-user", type=int, default=50, help="tasks seeded per account before the run")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", type=Path, help="write the results as a baseline JSON file")
+    parser.add_argument("--baseline", type=Path, help="compare against this baseline; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (default 0.2)")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run_remote(args) if args.url else run_in_process(args))
+    print_summary(summary)
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(summary, indent=2, sort_keys=True) + "\n")
+        print(f"baseline written to {args.save}")
+
+    if args.baseline:
+        try:
+            regressions = compare_to_baseline(summary, json.loads(args.baseline.read_text()), args.tolerance)
+        except ConfigMismatch as exc:
+            print(f"not comparable with {args.baseline}, which was recorded with a different config:")
+            for line in exc.args[0]:
+                print(f"  {line}")
+            sys.exit(2)
+        if regressions:
+            print(f"regressions against {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"no regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""Operational commands for the TaskFlow backend.
+
+Usage:
+    python manage.py ensure-indexes
+    python manage.py index-stats                      (mongo only)
+    python manage.py reindex-search [--all]           (mongo only)
+    python manage.py reconcile-counters [--email EMAIL] [--dry-run]
+    python manage.py prune-changes [--days DAYS]
+    python manage.py migrate-dates [--batch-size N]   (mongo only)
+    python manage.py migrate-ids [--batch-size N]     (mongo only)
+    python manage.py bench-serialization [--sizes 1000 10000] [--repeat 5]
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+import server
+
+
+def mongo_db():
+    """The database behind STORAGE_BACKEND=mongo, for commands that only exist there."""
+    db = getattr(server.storage, "db", None)
+    if db is None:
+        raise SystemExit(f"this command needs STORAGE_BACKEND=mongo, not {server.STORAGE_BACKEND}")
+    return db
+
+
+async def ensure_indexes(args):
+    created = await server.storage.ensure_indexes()
+    for collection, names in created.items():
+        print(f"{collection}: {', '.join(names) or '(failed, see log)'}")
+
+
+async def index_stats(args):
+    mongo_db()
+    report = await server.storage.index_usage()
+    if args.json:
+        print(json.dumps(report, default=str, indent=2))
+        return
+    for collection, indexes in report.items():
+        print(collection)
+        for index in sorted(indexes, key=lambda i: i["name"]):
+            print(
+                f"  {index['name']:<45} ops={index['ops']:<10} "
+                f"size={index['size_bytes']:<10} since={index['since']}"
+            )
+
+
+async def reindex_search(args):
+    query = {} if args.all else {"search_terms": {"$exists": False}}
+    cursor = mongo_db().tasks.find(query, {"_id": 1, "title": 1, "description": 1})
+    batch, updated = [], 0
+    async for task in cursor.batch_size(args.batch_size):
+        terms = server.build_search_terms(task.get("title"), task.get("description"))
+        batch.append(UpdateOne({"_id": task["_id"]}, {"$set": {"search_terms": terms}}))
+        if len(batch) >= args.batch_size:
+            updated += (await mongo_db().tasks.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await mongo_db().tasks.bulk_write(batch, ordered=False)).modified_count
+    print(f"search terms rebuilt for {updated} tasks")
+
+
+async def migrate_dates(args):
+    fields = ("created_at", "updated_at")
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    cursor = mongo_db().tasks.find(query, {"_id": 1, **{field: 1 for field in fields}})
+    batch, updated = [], 0
+    async for task in cursor.batch_size(args.batch_size):
+        converted = {
+            field: server.bson_datetime(task[field]) for field in fields if isinstance(task.get(field), str)
+        }
+        batch.append(UpdateOne({"_id": task["_id"]}, {"$set": converted}))
+        if len(batch) >= args.batch_size:
+            updated += (await mongo_db().tasks.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await mongo_db().tasks.bulk_write(batch, ordered=False)).modified_count
+    print(f"dates converted on {updated} tasks")
+
+
+# Indexes keyed on the string ``id`` field that task ids lived in before they moved to _id
+LEGACY_TASK_INDEXES = ("user_email_id", "user_email_updated_at_id", "user_email_created_at_id")
+
+
+async def task_storage():
+    stats = await mongo_db().command("collStats", "tasks")
+    return {
+        "documents": stats.get("count", 0),
+        "avg_document_bytes": stats.get("avgObjSize", 0),
+        "data_bytes": stats.get("size", 0),
+        "index_bytes": stats.get("totalIndexSize", 0),
+        "indexes": stats.get("indexSizes", {}),
+    }
+
+
+def print_storage_change(before, after):
+    # Data plus indexes is what has to stay in cache for the task routes
+    before["working_set_bytes"] = before["data_bytes"] + before["index_bytes"]
+    after["working_set_bytes"] = after["data_bytes"] + after["index_bytes"]
+    print(f"{'':<30} {'before':>14} {'after':>14}")
+    for key in ("documents", "avg_document_bytes", "data_bytes", "index_bytes", "working_set_bytes"):
+        print(f"{key:<30} {before[key]:>14} {after[key]:>14}")
+    for name in sorted(set(before["indexes"]) | set(after["indexes"])):
+        print(f"  {name:<28} {before['indexes'].get(name, '-'):>14} {after['indexes'].get(name, '-'):>14}")
+
+
+async def migrate_id_batch(tasks):
+    docs, old_ids = [], []
+    for task in tasks:
+        task_id = server.parse_task_id(task["id"])
+        if task_id is None:
+            print(f"skipping {task['_id']}: id {task['id']!r} is not a UUID")
+            continue
+        old_ids.append(task.pop("_id"))
+        del task["id"]
+        docs.append({"_id": task_id, **task})
+    if not docs:
+        return 0
+    # _id cannot be changed in place: write the new document, then drop the old one.
+    # A run interrupted between the two finds the new documents already there.
+    try:
+        await mongo_db().tasks.insert_many(docs, ordered=False)
+    except BulkWriteError as exc:
+        if any(err["code"] != 11000 for err in exc.details["writeErrors"]):
+            raise
+    await mongo_db().tasks.delete_many({"_id": {"$in": old_ids}})
+    return len(docs)
+
+
+async def migrate_ids(args):
+    before = await task_storage()
+    cursor = mongo_db().tasks.find({"id": {"$exists": True}})
+    batch, migrated = [], 0
+    async for task in cursor.batch_size(args.batch_size):
+        batch.append(task)
+        if len(batch) >= args.batch_size:
+            migrated += await migrate_id_batch(batch)
+            batch = []
+    if batch:
+        migrated += await migrate_id_batch(batch)
+
+    for name in LEGACY_TASK_INDEXES:
+        try:
+            await mongo_db().tasks.drop_index(name)
+        except OperationFailure:
+            pass
+    await server.storage.ensure_indexes()
+    print(f"moved {migrated} task ids into _id")
+    print_storage_change(before, await task_storage())
+
+
+async def reconcile_counters(args):
+    if args.email:
+        emails = [args.email]
+    else:
+        emails = await server.storage.task_owners()
+
+    drifted = 0
+    for email in emails:
+        result = await server.reconcile_task_counters(email, dry_run=args.dry_run)
+        if not result["reconciled"]:
+            print(f"{email}: tasks kept changing while counting, counters left as they were")
+            continue
+        if result["drift"]:
+            drifted += 1
+            print(f"{email}: {json.dumps(result['drift'], sort_keys=True)}")
+    action = "found" if args.dry_run else "fixed"
+    print(f"{len(emails)} users checked, drift {action} for {drifted}")
+
+
+async def prune_changes(args):
+    cutoff = datetime.now(timezone.utc) - timedelta(days=args.days)
+    deleted, users = await server.storage.prune_changes(cutoff)
+    print(f"pruned {deleted} change entries for {users} users")
+
+
+def sample_task_docs(count):
+    """Documents shaped like what TASK_PROJECTION returns for GET /api/tasks."""
+    now = server.utc_now()
+    return [
+        {
+            "_id": uuid.uuid4(),
+            "title": f"Task {i}",
+            "description": "Benchmark task description " * 3,
+            "status": server.TASK_STATUSES[i % 3],
+            "priority": server.TASK_PRIORITIES[i % 3],
+            "user_email": "bench@example.com",
+            "created_at": now,
+            "updated_at": now,
+            "revision": 1,
+        }
+        for i in range(count)
+    ]
+
+
+async def bench_serialization(args):
+    route = next(r for r in server.app.routes if getattr(r, "path", None) == "/api/tasks" and "GET" in r.methods)
+
+    async def response_model(docs):
+        # What get_tasks did before: Task per document, then response_model validation
+        content = await serialize_response(
+            field=route.response_field, response_content=[server.Task(**doc) for doc in docs], is_coroutine=True
+        )
+        return JSONResponse(content).body
+
+    def encoded_as(mode):
+        async def encode(docs):
+            server.TASK_LIST_SERIALIZATION = mode
+            return server.encode_task_list(docs)
+        return encode
+
+    modes = {
+        "response_model": response_model,
+        "validated": encoded_as("validated"),
+        "trusted": encoded_as("trusted"),
+    }
+    configured = server.TASK_LIST_SERIALIZATION
+    try:
+        for size in args.sizes:
+            docs = sample_task_docs(size)
+            for name, encode in modes.items():
+                best = float("inf")
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    await encode(docs)
+                    best = min(best, time.perf_counter() - started)
+                print(f"{size:>6} tasks  {name:<15} {best * 1000:8.2f} ms  {best / size * 1e6:6.2f} us/task")
+    finally:
+        server.TASK_LIST_SERIALIZATION = configured
+
+
+COMMANDS = {
+    "ensure-indexes": ensure_indexes,
+    "index-stats": index_stats,
+    "reindex-search": reindex_search,
+    "migrate-dates": migrate_dates,
+    "migrate-ids": migrate_ids,
+    "reconcile-counters": reconcile_counters,
+    "prune-changes": prune_changes,
+    "bench-serialization": bench_serialization,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TaskFlow backend management commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("ensure-indexes", help="create any missing indexes (idempotent)")
+    stats = sub.add_parser("index-stats", help="report index usage counts and sizes")
+    stats.add_argument("--json", action="store_true", help="print raw JSON")
+    reindex = sub.add_parser("reindex-search", help="backfill search_terms on existing tasks")
+    reindex.add_argument("--all", action="store_true", help="rebuild every task, not just missing ones")
+    reindex.add_argument("--batch-size", type=int, default=1000)
+    dates = sub.add_parser("migrate-dates", help="convert ISO string task dates to native datetimes")
+    dates.add_argument("--batch-size", type=int, default=1000)
+    ids = sub.add_parser("migrate-ids", help="move string task ids into a binary UUID _id")
+    ids.add_argument("--batch-size", type=int, default=1000)
+    reconcile = sub.add_parser("reconcile-counters", help="rebuild task_counters and report drift")
+    reconcile.add_argument("--email", help="only reconcile this user")
+    reconcile.add_argument("--dry-run", action="store_true", help="report drift without fixing it")
+    prune = sub.add_parser("prune-changes", help="drop task change log entries older than --days")
+    prune.add_argument("--days", type=float, default=30)
+    bench = sub.add_parser("bench-serialization", help="time GET /api/tasks encoding per task")
+    bench.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    bench.add_argument("--repeat", type=int, default=5)
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(COMMANDS[args.command](args))
+    finally:
+        asyncio.run(server.storage.close())
+
+
+if __name__ == "__main__":
+    main()
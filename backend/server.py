@@ -376,20 +376,41 @@
 #     client.close()
     
     
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Match
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, ConfigDict, EmailStr
-from typing import List, Optional
+from pydantic import AliasChoices, BaseModel, ConfigDict, EmailStr, Field, TypeAdapter, field_validator
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+from pymongo.errors import OperationFailure
+from collections import OrderedDict
+import base64
+import bisect
+import hashlib
+import hmac
+import json
+import math
+import orjson
+import re
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import threading
+import time
 import uuid
+import zlib
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+
+from storage import EPOCH, TASK_CONFLICT, TASK_SKIPPED, TASK_SORTS, TaskQuery, as_utc, create_storage, merge_counts
 
 # ================= ENV =================
 ROOT_DIR = Path(__file__).parent
@@ -397,18 +418,296 @@ load_dotenv(ROOT_DIR / ".env")
 
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://127.0.0.1:27017")
 DB_NAME = os.getenv("DB_NAME", "primeTrade")
+# mongo, memory (single process, nothing persisted) or sqlite (SQLITE_PATH)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+SQLITE_PATH = os.getenv("SQLITE_PATH", str(ROOT_DIR / "taskflow.db"))
+# Connection pool per server; defaults are pymongo's. A timeout of 0 means none.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_CONNECTING = int(os.getenv("MONGO_MAX_CONNECTING", "2"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "20000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0"))
+# primary, primaryPreferred, secondary, secondaryPreferred or nearest
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+HEALTH_PING_TIMEOUT_SECONDS = float(os.getenv("HEALTH_PING_TIMEOUT_SECONDS", "2"))
+# /health/ready fails once this share of the Mongo pool is checked out
+HEALTH_MAX_POOL_SATURATION = float(os.getenv("HEALTH_MAX_POOL_SATURATION", "1.0"))
+# Admins send this as an X-Profile header or ?profile= to profile one request; unset disables it
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_INTERVAL_SECONDS = float(os.getenv("PROFILING_INTERVAL_SECONDS", "0.001"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(ROOT_DIR / "profiles")))
+# Upper bounds in seconds of the request latency histogram buckets
+METRICS_LATENCY_BUCKETS = [
+    float(bound) for bound in os.getenv(
+        "METRICS_LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"
+    ).split(",")
+]
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+TOKEN_VERSION_TTL_SECONDS = float(os.getenv("TOKEN_VERSION_TTL_SECONDS", "30"))
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+LOGIN_RATE_PER_IP_PER_MINUTE = float(os.getenv("LOGIN_RATE_PER_IP_PER_MINUTE", "30"))
+LOGIN_BURST_PER_IP = int(os.getenv("LOGIN_BURST_PER_IP", "10"))
+LOGIN_RATE_PER_EMAIL_PER_MINUTE = float(os.getenv("LOGIN_RATE_PER_EMAIL_PER_MINUTE", "5"))
+LOGIN_BURST_PER_EMAIL = int(os.getenv("LOGIN_BURST_PER_EMAIL", "5"))
+LOGIN_MAX_CONCURRENT_VERIFICATIONS = int(os.getenv("LOGIN_MAX_CONCURRENT_VERIFICATIONS", "8"))
 
 # ================= DB =================
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": MONGO_MAX_POOL_SIZE,
+    "minPoolSize": MONGO_MIN_POOL_SIZE,
+    "maxConnecting": MONGO_MAX_CONNECTING,
+    "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS or None,
+    "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+    "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+    "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS or None,
+    "readPreference": MONGO_READ_PREFERENCE,
+}
+
+storage = create_storage(STORAGE_BACKEND, MONGO_URL, DB_NAME, SQLITE_PATH, MONGO_CLIENT_OPTIONS)
 
 # ================= SECURITY =================
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 1440
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+REVOCATION_FILTER_CAPACITY = int(os.getenv("REVOCATION_FILTER_CAPACITY", "100000"))
+REVOCATION_FILTER_ERROR_RATE = float(os.getenv("REVOCATION_FILTER_ERROR_RATE", "0.001"))
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "15"))
+# "trusted" encodes task lists straight from the projected documents,
+# "validated" runs them through the Task model once before encoding
+TASK_LIST_SERIALIZATION = os.getenv("TASK_LIST_SERIALIZATION", "trusted")
+TASK_PAGE_MAX_SIZE = int(os.getenv("TASK_PAGE_MAX_SIZE", "1000"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+SEARCH_MAX_PREFIX = int(os.getenv("SEARCH_MAX_PREFIX", "20"))
+SEARCH_MAX_TERMS = int(os.getenv("SEARCH_MAX_TERMS", "512"))
+# Search ranks only this many matches, taken in the request's sort order
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", str(TASK_PAGE_MAX_SIZE)))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+CHANGES_PAGE_SIZE = int(os.getenv("CHANGES_PAGE_SIZE", "500"))
+CHANGES_GAP_GRACE_SECONDS = float(os.getenv("CHANGES_GAP_GRACE_SECONDS", "10"))
+TASK_EVENTS_BROKER = os.getenv("TASK_EVENTS_BROKER", "local")
+TASK_EVENTS_QUEUE_SIZE = int(os.getenv("TASK_EVENTS_QUEUE_SIZE", "100"))
+TASK_EVENTS_MAX_INLINE = int(os.getenv("TASK_EVENTS_MAX_INLINE", "100"))
+TASK_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("TASK_EVENTS_HEARTBEAT_SECONDS", "15"))
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# ================= CACHE =================
+class TTLCache:
+    """In-process TTL + LRU cache keyed by string (usually a user's email)."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value) -> None:
+        if self.max_size <= 0 or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+user_cache = TTLCache(max_size=USER_CACHE_MAX_SIZE, ttl_seconds=USER_CACHE_TTL_SECONDS)
+
+# email -> current token_version, always filled straight from storage
+token_versions = TTLCache(max_size=USER_CACHE_MAX_SIZE, ttl_seconds=TOKEN_VERSION_TTL_SECONDS)
+
+# ================= PROFILING =================
+# Spans of the current request, or None outside one
+request_spans: ContextVar[Optional[list]] = ContextVar("request_spans", default=None)
+
+# phase -> [count, total seconds] across all requests; only touched from the event loop
+span_totals: Dict[str, list] = {}
+
+class span:
+    """Times a phase of request handling: ``with span("db_query"): ...``.
+
+    Always on; costs two clock reads and a dict update.
+    """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        totals = span_totals.get(self.name)
+        if totals is None:
+            totals = span_totals[self.name] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += elapsed
+        spans = request_spans.get()
+        if spans is not None:
+            spans.append((self.name, elapsed))
+        return False
+
+class SamplingProfiler:
+    """Samples the stack of one asyncio task from a helper thread.
+
+    Samples are only kept while that task is the one running on the event
+    loop, so concurrent requests do not show up in its profile; time spent
+    awaiting I/O does not either, which is what the spans are for. Stacks are
+    counted in the folded format flamegraph.pl and speedscope read.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, task: asyncio.Task) -> None:
+        self._thread = threading.Thread(
+            target=self._sample,
+            args=(task, asyncio.get_running_loop(), threading.get_ident()),
+            name="request-profiler",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _sample(self, task: asyncio.Task, loop: asyncio.AbstractEventLoop, thread_id: int) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None or asyncio.current_task(loop) is not task:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack = ";".join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+def profiling_requested(scope) -> bool:
+    if not PROFILING_TOKEN:
+        return False
+    supplied = None
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            supplied = value.decode("latin-1")
+            break
+    if supplied is None and b"profile=" in scope["query_string"]:
+        supplied = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [None])[0]
+    return supplied is not None and hmac.compare_digest(supplied.encode(), PROFILING_TOKEN.encode())
+
+class ProfilingMiddleware:
+    """Collects spans for every request; profiles the ones an admin asks for.
+
+    A profiled response carries the spans in a Server-Timing header and the
+    name of the folded-stack file written to PROFILE_DIR in X-Profile-File.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        spans = []
+        token = request_spans.set(spans)
+        try:
+            if not profiling_requested(scope):
+                await self.app(scope, receive, send)
+                return
+            await self._profile(scope, receive, send, spans)
+        finally:
+            request_spans.reset(token)
+
+    async def _profile(self, scope, receive, send, spans: list) -> None:
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", scope["path"]).strip("-") or "root"
+        filename = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%fZ}-{scope['method']}-{slug}.folded"
+        started = time.perf_counter()
+
+        async def send_with_timings(message):
+            if message["type"] == "http.response.start":
+                timings = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in spans]
+                timings.append(f"total;dur={(time.perf_counter() - started) * 1000:.3f}")
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"server-timing", ", ".join(timings).encode()),
+                    (b"x-profile-file", filename.encode()),
+                ]
+            await send(message)
+
+        profiler = SamplingProfiler(PROFILING_INTERVAL_SECONDS)
+        profiler.start(asyncio.current_task())
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            profiler.stop()
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            (PROFILE_DIR / filename).write_text(profiler.folded())
+            logging.getLogger(__name__).info(
+                "Profiled %s %s: %d samples in %s", scope["method"], scope["path"], profiler.samples, filename
+            )
 
 # ================= APP =================
 app = FastAPI()
@@ -421,6 +720,85 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password[:72])
 
+class PasswordHasher:
+    """Runs bcrypt work on a bounded worker pool so it never blocks the event loop.
+
+    At most ``max_workers + max_queue`` operations may be in flight; anything
+    beyond that is rejected with a 503 instead of queueing without bound.
+    """
+
+    def __init__(self, kind: str, max_workers: int, max_queue: int):
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor: Optional[Executor] = None
+        self.in_flight = 0
+        self.rejected = 0
+        self.latency = {
+            op: {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            for op in ("hash", "verify")
+        }
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="password-hash"
+                )
+        return self._executor
+
+    async def _run(self, op: str, fn, *args):
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Authentication service busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+            elapsed = time.perf_counter() - start
+            stats = self.latency[op]
+            stats["count"] += 1
+            stats["total_seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", verify_password, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.max_workers),
+            "rejected": self.rejected,
+            "latency": {op: dict(stats) for op, stats in self.latency.items()},
+        }
+
+password_hasher = PasswordHasher(
+    kind=PASSWORD_HASH_EXECUTOR,
+    max_workers=PASSWORD_HASH_WORKERS,
+    max_queue=PASSWORD_HASH_MAX_QUEUE,
+)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (
@@ -429,22 +807,267 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def user_token_claims(user: dict) -> dict:
+    return {
+        "sub": user["email"],
+        "name": user["name"],
+        "created_at": user["created_at"],
+        "ver": user.get("token_version", 0),
+    }
+
+def create_refresh_token(email: str) -> str:
+    return create_access_token(
+        data={"sub": email, "type": "refresh", "jti": uuid.uuid4().hex},
+        expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+
+def issue_token(user: dict) -> "Token":
+    return Token(
+        access_token=create_access_token(
+            data=user_token_claims(user),
+            expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+        ),
+        refresh_token=create_refresh_token(user["email"]),
+        token_type="bearer",
+        user=UserResponse(
+            email=user["email"],
+            name=user["name"],
+            created_at=user["created_at"],
+        ),
+    )
+
+async def fetch_user(email: str) -> dict:
+    """Read the user from storage, bypassing both caches, and refill them."""
+    user = await storage.get_user(email)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    user_cache.set(email, user)
+    token_versions.set(email, user.get("token_version", 0))
+    return user
+
+async def load_user(email: str) -> dict:
+    user = user_cache.get(email)
+    if user is None:
+        user = await fetch_user(email)
+    return user
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await authenticate_token(credentials.credentials)
+
+async def authenticate_token(token: str) -> dict:
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with span("jwt_decode"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
-        if not email:
+        if not email or payload.get("type") == "refresh":
             raise Exception()
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    user = await db.users.find_one({"email": email}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid credentials")
-
+    # The version is never taken from user_cache, so a token revoked on another
+    # worker stops working within TOKEN_VERSION_TTL_SECONDS
+    user = None
+    with span("user_lookup"):
+        version = token_versions.get(email)
+        # A newer token than the cached version was issued after it was read
+        if version is None or payload.get("ver", 0) > version:
+            user = await fetch_user(email)
+            version = user.get("token_version", 0)
+
+    if payload.get("ver", 0) != version:
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+
+    # Tokens carrying profile claims are answered without touching the database
+    if "name" in payload and "created_at" in payload:
+        return {"email": email, "name": payload["name"], "created_at": payload["created_at"]}
+
+    if user is None:
+        with span("user_lookup"):
+            user = await load_user(email)
     return user
 
+# ================= ADMISSION CONTROL =================
+class TokenBucketLimiter:
+    """Per-key token buckets; the oldest idle keys are dropped once max_keys is reached."""
+
+    def __init__(self, rate_per_minute: float, burst: int, max_keys: int = 100_000):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def acquire(self, key: str) -> float:
+        """Take one token for ``key``; returns 0 on success or the seconds to wait."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(self.burst), now]
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            tokens = bucket[0] + (now - bucket[1]) * self.rate_per_second
+            bucket[0] = min(float(self.burst), tokens)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        if self.rate_per_second <= 0:
+            return 60.0
+        return (1 - bucket[0]) / self.rate_per_second
+
+class LoginAdmission:
+    """Cheap checks that run before any database or bcrypt work on /auth/login."""
+
+    def __init__(self, ip_limiter: TokenBucketLimiter, email_limiter: TokenBucketLimiter,
+                 max_concurrent_verifications: int):
+        self.ip_limiter = ip_limiter
+        self.email_limiter = email_limiter
+        self.max_concurrent_verifications = max(1, max_concurrent_verifications)
+        self.verifications_in_flight = 0
+        self.admitted = 0
+        self.shed = {"ip_rate": 0, "email_rate": 0, "concurrency": 0}
+
+    def admit(self, client_ip: str, email: str) -> None:
+        for reason, limiter, key in (
+            ("ip_rate", self.ip_limiter, client_ip),
+            ("email_rate", self.email_limiter, email.lower()),
+        ):
+            retry_after = limiter.acquire(key)
+            if retry_after:
+                self.shed[reason] += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many login attempts, please retry later",
+                    headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+                )
+        self.admitted += 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        if self.verifications_in_flight >= self.max_concurrent_verifications:
+            self.shed["concurrency"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Authentication service busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.verifications_in_flight += 1
+        try:
+            return await password_hasher.verify(plain_password, hashed_password)
+        finally:
+            self.verifications_in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "verifications_in_flight": self.verifications_in_flight,
+            "max_concurrent_verifications": self.max_concurrent_verifications,
+            "shed": dict(self.shed),
+            "hashes_shed": sum(self.shed.values()),
+        }
+
+login_admission = LoginAdmission(
+    ip_limiter=TokenBucketLimiter(LOGIN_RATE_PER_IP_PER_MINUTE, LOGIN_BURST_PER_IP),
+    email_limiter=TokenBucketLimiter(LOGIN_RATE_PER_EMAIL_PER_MINUTE, LOGIN_BURST_PER_EMAIL),
+    max_concurrent_verifications=LOGIN_MAX_CONCURRENT_VERIFICATIONS,
+)
+
+# ================= REVOCATION =================
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over a blake2b digest."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+class RevocationList:
+    """Revoked refresh-token ids: Bloom filter in memory, authoritative copy in storage.
+
+    A negative filter lookup answers without I/O; only possible hits are
+    confirmed against the stored revoked tokens.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.filter = BloomFilter(capacity, error_rate)
+        self.last_sync: Optional[datetime] = None
+        self.checks = 0
+        self.confirmations = 0
+        self.false_positives = 0
+
+    async def load(self) -> None:
+        now = datetime.now(timezone.utc)
+        self.filter = BloomFilter(self.capacity, self.error_rate)
+        for jti in await storage.revoked_token_ids(expires_after=now):
+            self.filter.add(jti)
+        self.last_sync = now
+
+    async def sync(self) -> None:
+        """Pick up tokens revoked by other workers since the last sync."""
+        if self.last_sync is None or self.filter.count >= self.capacity:
+            await self.load()
+            return
+        now = datetime.now(timezone.utc)
+        for jti in await storage.revoked_token_ids(revoked_since=self.last_sync):
+            self.filter.add(jti)
+        self.last_sync = now
+
+    async def revoke(self, jti: str, expires_at: datetime) -> bool:
+        """Revoke ``jti``; False if any worker had already revoked it."""
+        revoked = await storage.revoke_token(jti, expires_at, datetime.now(timezone.utc))
+        self.filter.add(jti)
+        return revoked
+
+    async def is_revoked(self, jti: str) -> bool:
+        self.checks += 1
+        if jti not in self.filter:
+            return False
+        self.confirmations += 1
+        if await storage.is_token_revoked(jti):
+            return True
+        self.false_positives += 1
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "filter_bits": self.filter.size,
+            "filter_hashes": self.filter.hash_count,
+            "filter_entries": self.filter.count,
+            "checks": self.checks,
+            "confirmations": self.confirmations,
+            "false_positives": self.false_positives,
+        }
+
+revocation_list = RevocationList(REVOCATION_FILTER_CAPACITY, REVOCATION_FILTER_ERROR_RATE)
+
+async def sync_revocations_forever() -> None:
+    while True:
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+        try:
+            await revocation_list.sync()
+        except Exception:
+            logging.getLogger(__name__).exception("Revocation list sync failed")
+
 # ================= MODELS =================
 class UserRegister(BaseModel):
     name: str
@@ -465,10 +1088,22 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     user: UserResponse
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class UserUpdate(BaseModel):
     name: Optional[str] = None
 
+class TaskStats(BaseModel):
+    total: int
+    by_status: Dict[str, int]
+    by_priority: Dict[str, int]
+    completion_rate: float
+    in_progress_rate: float
+    pending_rate: float
+
 class TaskCreate(BaseModel):
     title: str
     description: Optional[str] = None
@@ -481,68 +1116,128 @@ class TaskUpdate(BaseModel):
     status: Optional[str] = None
     priority: Optional[str] = None
 
+class TaskBulkCreate(BaseModel):
+    tasks: List[TaskCreate] = Field(max_length=BULK_MAX_ITEMS)
+    ordered: bool = True
+
+class TaskBulkUpdateItem(TaskUpdate):
+    id: str
+
+class TaskBulkUpdate(BaseModel):
+    updates: List[TaskBulkUpdateItem] = Field(max_length=BULK_MAX_ITEMS)
+    ordered: bool = True
+
+class TaskBulkDelete(BaseModel):
+    ids: List[str] = Field(max_length=BULK_MAX_ITEMS)
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+
+class BulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
 class Task(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str
+    # Stored as the document's _id (a UUID), rendered as its string form
+    id: str = Field(validation_alias=AliasChoices("id", "_id"))
     title: str
     description: Optional[str] = None
     status: str
     priority: str
     user_email: str
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
+    revision: int = 0
+
+    @field_validator("id", mode="before")
+    @classmethod
+    def id_as_string(cls, value) -> str:
+        return value if isinstance(value, str) else str(value)
+
+    @field_validator("created_at", "updated_at")
+    @classmethod
+    def assume_utc(cls, value: datetime) -> datetime:
+        # Mongo hands back naive datetimes that are always UTC
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+class TaskChanges(BaseModel):
+    cursor: int
+    has_more: bool
+    upserted: List[Task]
+    deleted: List[str]
 
 # ================= AUTH =================
 @api_router.post("/auth/register", response_model=Token)
 async def register(user: UserRegister):
-    existing_user = await db.users.find_one({"email": user.email})
-    if existing_user:
+    # Checked before hashing so a taken email costs no bcrypt work
+    if await storage.get_user(user.email):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     user_doc = {
         "email": user.email,
         "name": user.name,
-        "password": get_password_hash(user.password),
+        "password": await password_hasher.hash(user.password),
         "created_at": datetime.now(timezone.utc).isoformat(),
+        "token_version": 0,
     }
 
-    await db.users.insert_one(user_doc)
+    # The insert itself rejects a concurrent registration of the same email
+    if not await storage.create_user(user_doc):
+        raise HTTPException(status_code=400, detail="Email already registered")
 
-    access_token = create_access_token(
-        data={"sub": user.email},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
-    )
-
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        user=UserResponse(
-            email=user.email,
-            name=user.name,
-            created_at=user_doc["created_at"],
-        ),
-    )
+    return issue_token(user_doc)
 
 @api_router.post("/auth/login", response_model=Token)
-async def login(user_login: UserLogin):
-    user = await db.users.find_one({"email": user_login.email})
-    if not user or not verify_password(user_login.password, user["password"]):
+async def login(user_login: UserLogin, request: Request):
+    login_admission.admit(request.client.host if request.client else "unknown", user_login.email)
+
+    user = await storage.get_user(user_login.email, include_password=True)
+    if not user or not await login_admission.verify(user_login.password, user["password"]):
         raise HTTPException(status_code=401, detail="Incorrect email or password")
 
-    access_token = create_access_token(
-        data={"sub": user["email"]},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
-    )
+    return issue_token(user)
 
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        user=UserResponse(
-            email=user["email"],
-            name=user["name"],
-            created_at=user["created_at"],
-        ),
-    )
+async def decode_refresh_token(refresh_token: str) -> dict:
+    try:
+        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+        if payload.get("type") != "refresh" or not payload.get("sub") or not payload.get("jti"):
+            raise Exception()
+    except Exception:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    if await revocation_list.is_revoked(payload["jti"]):
+        raise HTTPException(status_code=401, detail="Refresh token has been revoked")
+
+    return payload
+
+async def revoke_refresh_token(payload: dict) -> None:
+    # The storage write is the arbiter: other workers' filters lag by up to
+    # REVOCATION_SYNC_SECONDS and concurrent requests all pass is_revoked
+    if not await revocation_list.revoke(
+        payload["jti"], datetime.fromtimestamp(payload["exp"], timezone.utc)
+    ):
+        raise HTTPException(status_code=401, detail="Refresh token has been revoked")
+
+@api_router.post("/auth/refresh", response_model=Token)
+async def refresh(body: RefreshRequest):
+    payload = await decode_refresh_token(body.refresh_token)
+    # Rotate: the presented refresh token is single-use
+    await revoke_refresh_token(payload)
+
+    # Read fresh so the new token does not carry stale name or version claims
+    user = await fetch_user(payload["sub"])
+    return issue_token(user)
+
+@api_router.post("/auth/logout")
+async def logout(body: RefreshRequest):
+    payload = await decode_refresh_token(body.refresh_token)
+    await revoke_refresh_token(payload)
+    return {"message": "Logged out successfully"}
 
 @api_router.get("/auth/profile", response_model=UserResponse)
 async def get_profile(current_user: dict = Depends(get_current_user)):
@@ -555,19 +1250,27 @@ async def get_profile(current_user: dict = Depends(get_current_user)):
 @api_router.put("/auth/profile", response_model=UserResponse)
 async def update_profile(
     user_update: UserUpdate,
+    response: Response,
     current_user: dict = Depends(get_current_user)
 ):
     update_data = {}
     if user_update.name:
         update_data["name"] = user_update.name
     
-    if update_data:
-        await db.users.update_one(
-            {"email": current_user["email"]},
-            {"$set": update_data}
-        )
-    
-    updated_user = await db.users.find_one({"email": current_user["email"]}, {"_id": 0})
+    if not update_data:
+        return UserResponse(**current_user)
+
+    # Bumping the version revokes every token carrying the old profile claims
+    updated_user = await storage.update_user(current_user["email"], update_data)
+    if updated_user is None:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    user_cache.invalidate(current_user["email"])
+    token_versions.set(updated_user["email"], updated_user.get("token_version", 0))
+    response.headers["X-Access-Token"] = create_access_token(
+        data=user_token_claims(updated_user),
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
     
     return UserResponse(
         email=updated_user["email"],
@@ -575,61 +1278,821 @@ async def update_profile(
         created_at=updated_user["created_at"]
     )
 
+# ================= SEARCH =================
+# Tasks carry a ``search_terms`` array with every word of the title and
+# description plus each word's prefixes, so a per-user multikey index
+# answers prefix queries without scanning the user's tasks.
+WORD_RE = re.compile(r"\w+")
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [word[:SEARCH_MAX_PREFIX] for word in WORD_RE.findall((text or "").lower())]
+
+def build_search_terms(title: Optional[str], description: Optional[str]) -> List[str]:
+    terms = {}
+    for word in tokenize(title) + tokenize(description):
+        for end in range(1, len(word) + 1):
+            terms[word[:end]] = None
+        if len(terms) >= SEARCH_MAX_TERMS:
+            break
+    return list(terms)[:SEARCH_MAX_TERMS]
+
+def search_score(task: dict, query_words: List[str]) -> int:
+    title_words = tokenize(task.get("title"))
+    description_words = tokenize(task.get("description"))
+    score = 0
+    for query_word in query_words:
+        if query_word in title_words:
+            score += 4
+        elif any(word.startswith(query_word) for word in title_words):
+            score += 2
+        if query_word in description_words:
+            score += 2
+        elif any(word.startswith(query_word) for word in description_words):
+            score += 1
+    return score
+
+def rank_search_results(tasks: List[dict], query_words: List[str]) -> List[dict]:
+    # Ties keep the sort order the query returned them in
+    return sorted(tasks, key=lambda task: search_score(task, query_words), reverse=True)
+
+# ================= TASK COUNTERS =================
+# Per-user counters, kept current on every task write so stats are a point
+# lookup. reconcile_task_counters() rebuilds them from the tasks themselves
+# and reports any drift. Alongside them lives ``version``, bumped by every
+# task write, which backs the ETag of GET /api/tasks and numbers the change
+# log: each write appends exactly one change entry whose ``seq`` is the new
+# version.
+TASK_STATUSES = ("pending", "in-progress", "completed")
+TASK_PRIORITIES = ("low", "medium", "high")
+RECONCILE_ATTEMPTS = 3
+
+def build_task_stats(by_status: Dict[str, int], by_priority: Dict[str, int]) -> TaskStats:
+    by_status = {**{key: 0 for key in TASK_STATUSES}, **by_status}
+    by_priority = {**{key: 0 for key in TASK_PRIORITIES}, **by_priority}
+    total = sum(by_status.values())
+
+    def rate(count: int) -> float:
+        return round(count / total * 100, 2) if total else 0.0
+
+    return TaskStats(
+        total=total,
+        by_status=by_status,
+        by_priority=by_priority,
+        completion_rate=rate(by_status["completed"]),
+        in_progress_rate=rate(by_status["in-progress"]),
+        pending_rate=rate(by_status["pending"]),
+    )
+
+async def record_task_write(
+    email: str,
+    changes: Dict[str, Dict[str, int]],
+    upserted: List[str] = (),
+    deleted: List[str] = (),
+) -> None:
+    """Log a write to the given task ids: apply counter deltas such as
+    ``{"status": {"pending": -1, "completed": 1}}``, bump the version and
+    append the matching task_changes entry."""
+    if not upserted and not deleted:
+        return
+
+    entry = await storage.record_write(
+        email, changes,
+        upserted=list(dict.fromkeys(upserted)),
+        deleted=list(dict.fromkeys(deleted)),
+        at=datetime.now(timezone.utc),
+    )
+    # The write has committed; a failed notification must not turn it into an
+    # error the client would retry. Local subscribers reload instead.
+    try:
+        await task_events.publish(email, entry)
+    except Exception:
+        logging.getLogger(__name__).exception("Publishing task change %s for %s failed", entry.get("seq"), email)
+        task_events.resync(email)
+
+async def task_collection_version(email: str) -> int:
+    return await storage.get_version(email)
+
+def task_counter_changes(before: dict, update_data: dict) -> Dict[str, Dict[str, int]]:
+    changes = {}
+    for field in ("status", "priority"):
+        if field in update_data and update_data[field] != before[field]:
+            changes[field] = {before[field]: -1, update_data[field]: 1}
+    return changes
+
+async def reconcile_task_counters(email: str, dry_run: bool = False) -> dict:
+    """Rebuild one user's counters from scratch; drift is actual minus recorded, per key.
+
+    The counts are only written if no task write bumped the version while the
+    tasks were being counted; after RECONCILE_ATTEMPTS lost races the counters
+    are left as they were and ``reconciled`` is False.
+    """
+    for _ in range(RECONCILE_ATTEMPTS):
+        stored = await storage.get_counters(email) or {}
+        by_status, by_priority = await storage.count_tasks(email)
+
+        drift = {}
+        for field, actual in (("status", by_status), ("priority", by_priority)):
+            recorded = stored.get(field, {})
+            diff = {
+                key: actual.get(key, 0) - recorded.get(key, 0)
+                for key in set(actual) | set(recorded)
+                if actual.get(key, 0) != recorded.get(key, 0)
+            }
+            if diff:
+                drift[field] = diff
+
+        reconciled = dry_run or await storage.set_counts(
+            email, by_status, by_priority, datetime.now(timezone.utc), stored.get("version", 0)
+        )
+        if reconciled:
+            break
+    return {
+        "user_email": email,
+        "drift": drift,
+        "by_status": by_status,
+        "by_priority": by_priority,
+        "reconciled": reconciled,
+    }
+
+# ================= TASK EVENTS =================
+# Per-user push of task changes. Events are built from task_changes
+# entries: the local broker receives them straight from record_task_write,
+# the change-stream broker tails the collection so every worker sees writes
+# made by every other worker.
+async def build_task_event(entry: dict) -> dict:
+    if len(entry["upserted"]) > TASK_EVENTS_MAX_INLINE:
+        return {"type": "resync", "since": entry["seq"] - 1}
+
+    tasks = await storage.find_tasks(entry["user_email"], parse_task_ids(entry["upserted"]))
+    found = {str(task["_id"]) for task in tasks}
+    return {
+        "type": "tasks",
+        "seq": entry["seq"],
+        "upserted": [Task(**task).model_dump(mode="json") for task in tasks],
+        "deleted": entry["deleted"] + [task_id for task_id in entry["upserted"] if task_id not in found],
+    }
+
+class LocalTaskEventBroker:
+    """In-process fan-out to each user's subscriber queues."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, set] = {}
+        self.published = 0
+        self.overflows = 0
+
+    def subscribe(self, email: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(email, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, email: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(email)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[email]
+
+    async def publish(self, email: str, entry: dict) -> None:
+        await self._dispatch(email, entry)
+
+    async def _dispatch(self, email: str, entry: dict) -> None:
+        # Nobody listening for this user means no event is built at all
+        queues = self._subscribers.get(email)
+        if not queues:
+            return
+        event = await build_task_event(entry)
+        self.published += 1
+        for queue in list(queues):
+            if queue.full():
+                # A slow consumer gets one resync instead of an unbounded backlog
+                self.overflows += 1
+                self._resync(queue)
+            else:
+                queue.put_nowait(event)
+
+    @staticmethod
+    def _resync(queue: asyncio.Queue) -> None:
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait({"type": "resync", "since": None})
+
+    def resync(self, email: str) -> None:
+        """Tell every local subscriber of ``email`` to reload."""
+        for queue in list(self._subscribers.get(email, ())):
+            self._resync(queue)
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "published": self.published,
+            "overflows": self.overflows,
+        }
+
+class ChangeStreamTaskEventBroker(LocalTaskEventBroker):
+    """Feeds local subscribers from a change stream on task_changes (Mongo storage on a replica set)."""
+
+    retry_seconds = 1.0
+
+    def __init__(self, queue_size: int):
+        super().__init__(queue_size)
+        self._watcher: Optional[asyncio.Task] = None
+
+    async def publish(self, email: str, entry: dict) -> None:
+        # The insert into task_changes reaches every worker through the stream
+        pass
+
+    async def _watch(self) -> None:
+        # Reconnects pick up where the last stream stopped. When that point can
+        # no longer be resumed, every subscriber is told to reload instead.
+        resume_token = None
+        resync = False
+        while True:
+            try:
+                async for entry, token in storage.watch_changes(resume_after=resume_token):
+                    if entry is None:
+                        if resync:
+                            self.resync_all()
+                            resync = False
+                    else:
+                        await self._dispatch(entry["user_email"], entry)
+                    resume_token = token or resume_token
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure:
+                # Typically the resume point has fallen off the oplog
+                logging.getLogger(__name__).exception("Task change stream cannot resume; resyncing subscribers")
+                resume_token, resync = None, True
+                await asyncio.sleep(self.retry_seconds)
+            except Exception:
+                logging.getLogger(__name__).exception("Task change stream failed; reconnecting")
+                await asyncio.sleep(self.retry_seconds)
+
+    def resync_all(self) -> None:
+        for email in list(self._subscribers):
+            self.resync(email)
+
+    async def start(self) -> None:
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+TASK_EVENT_BROKERS = {
+    "local": LocalTaskEventBroker,
+    "changestream": ChangeStreamTaskEventBroker,
+}
+
+if TASK_EVENTS_BROKER not in TASK_EVENT_BROKERS:
+    raise ValueError(f"Unknown TASK_EVENTS_BROKER {TASK_EVENTS_BROKER!r}; expected local or changestream")
+# Otherwise the watcher would fail and retry every second for the life of the process
+if TASK_EVENTS_BROKER == "changestream" and not storage.can_watch_changes:
+    raise ValueError(f"TASK_EVENTS_BROKER=changestream needs STORAGE_BACKEND=mongo, not {STORAGE_BACKEND!r}")
+task_events = TASK_EVENT_BROKERS[TASK_EVENTS_BROKER](TASK_EVENTS_QUEUE_SIZE)
+
+def format_sse(event: dict) -> str:
+    lines = []
+    if event.get("seq") is not None:
+        lines.append(f"id: {event['seq']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+# ================= TASK QUERIES =================
+# Task timestamps are kept to BSON's millisecond precision. GET /api/tasks pages by
+# keyset on (sort field, _id), handed to clients as opaque cursors.
+def parse_utc(value) -> datetime:
+    """as_utc() that also takes the ISO 8601 strings older task documents hold."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return as_utc(value)
+
+def bson_datetime(value) -> datetime:
+    # BSON dates keep milliseconds; truncate so responses match what is stored
+    value = parse_utc(value)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+def utc_now() -> datetime:
+    return bson_datetime(datetime.now(timezone.utc))
+
+def encode_task_cursor(task: dict, sort: str = "-updated_at") -> str:
+    field, _ = TASK_SORTS[sort]
+    millis = (parse_utc(task[field]) - EPOCH) // timedelta(milliseconds=1)
+    raw = json.dumps([sort, millis, str(task["_id"])], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_task_cursor(cursor: str, sort: str = "-updated_at") -> Tuple[datetime, uuid.UUID]:
+    """The (sort value, _id) position a cursor continues after."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, millis, task_id = json.loads(raw)
+        if cursor_sort != sort or not isinstance(millis, int):
+            raise ValueError()
+        task_id = uuid.UUID(task_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return EPOCH + timedelta(milliseconds=millis), task_id
+
+def build_task_query(
+    email: str,
+    search: Optional[str] = None,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    limit: int = TASK_PAGE_MAX_SIZE,
+    cursor: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    sort: str = "-updated_at",
+) -> Tuple[TaskQuery, List[str]]:
+    """The storage query for GET /api/tasks and the words to rank search results by."""
+    if sort not in TASK_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(TASK_SORTS)}")
+
+    query = TaskQuery(
+        user_email=email,
+        status=status,
+        priority=priority,
+        # Half-open ranges on the same index field as the sort are a range scan
+        created_after=created_after and as_utc(created_after),
+        created_before=created_before and as_utc(created_before),
+        updated_after=updated_after and as_utc(updated_after),
+        updated_before=updated_before and as_utc(updated_before),
+        sort=sort,
+    )
+    query_words = tokenize(search)
+
+    if search:
+        if cursor:
+            raise HTTPException(status_code=400, detail="cursor cannot be combined with search")
+        # Every query word must match a whole word or a word prefix. Only the
+        # first SEARCH_RANK_WINDOW matches in ``sort`` order (most recently
+        # updated by default) are ranked, so a better match further back is
+        # not returned once a user has more matches than that.
+        query.terms = list(dict.fromkeys(query_words))
+        query.limit = max(limit, SEARCH_RANK_WINDOW)
+        return query, query_words
+
+    if cursor:
+        query.after = decode_task_cursor(cursor, sort)
+    # Fetch one extra document to learn whether another page exists
+    query.limit = limit + 1
+    return query, query_words
+
 # ================= TASK ROUTES =================
-@api_router.post("/tasks", response_model=Task)
-async def create_task(
-    task: TaskCreate,
-    current_user: dict = Depends(get_current_user)
-):
-    task_doc = {
-        "id": str(uuid.uuid4()),
+# Fields older documents may lack, filled in the way Task(**task) would
+TASK_DEFAULTS = {name: field.default for name, field in Task.model_fields.items() if not field.is_required()}
+TASK_LIST_ADAPTER = TypeAdapter(List[Task])
+
+def encode_task_list(tasks: List[dict]) -> bytes:
+    if TASK_LIST_SERIALIZATION == "validated":
+        return TASK_LIST_ADAPTER.dump_json(TASK_LIST_ADAPTER.validate_python(tasks))
+    # Storage returns exactly the Task fields, so the documents already have
+    # its shape apart from the id living in _id; orjson renders UUIDs as strings
+    encoded = []
+    for task in tasks:
+        task = {"id": task["_id"], **TASK_DEFAULTS, **task}
+        del task["_id"]
+        encoded.append(task)
+    # default=str covers ObjectId _ids on tasks migrate-ids could not convert
+    return orjson.dumps(encoded, default=str, option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z)
+
+def task_list_response(tasks: List[dict], headers: Dict[str, str]) -> Response:
+    # Returned directly so FastAPI does not validate and serialise it a second time
+    with span("serialize"):
+        content = encode_task_list(tasks)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+def parse_task_id(task_id: str) -> Optional[uuid.UUID]:
+    # Anything that is not a UUID names no task; None matches no _id
+    try:
+        return uuid.UUID(task_id)
+    except (TypeError, ValueError):
+        return None
+
+def parse_task_ids(task_ids: List[str]) -> List[uuid.UUID]:
+    return [task_id for task_id in map(parse_task_id, task_ids) if task_id is not None]
+
+def new_task_doc(task: TaskCreate, email: str) -> dict:
+    now = utc_now()
+    return {
+        "_id": uuid.uuid4(),
         "title": task.title,
         "description": task.description,
         "status": task.status,
         "priority": task.priority,
-        "user_email": current_user["email"],
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "updated_at": datetime.now(timezone.utc).isoformat()
+        "user_email": email,
+        "created_at": now,
+        "updated_at": now,
+        "search_terms": build_search_terms(task.title, task.description),
+        "revision": 1,
     }
+
+def task_update_fields(task: dict, task_update: TaskUpdate) -> dict:
+    """The $set document for applying ``task_update`` to the stored ``task``."""
+    update_data = {"updated_at": utc_now()}
     
-    await db.tasks.insert_one(task_doc)
+    if task_update.title is not None:
+        update_data["title"] = task_update.title
+    if task_update.description is not None:
+        update_data["description"] = task_update.description
+    if task_update.status is not None:
+        update_data["status"] = task_update.status
+    if task_update.priority is not None:
+        update_data["priority"] = task_update.priority
+    if task_update.title is not None or task_update.description is not None:
+        update_data["search_terms"] = build_search_terms(
+            update_data.get("title", task["title"]),
+            update_data.get("description", task.get("description")),
+        )
+    return update_data
+
+def task_etag(task: dict) -> str:
+    return f'"{task.get("revision", 0)}"'
+
+def task_list_etag(email: str, version: int, request: Request) -> str:
+    # The user is part of the tag so a shared browser cache never revalidates
+    # one user's list with another user's tag
+    variant = hashlib.blake2b(
+        f"{email}\n{sorted(request.query_params.multi_items())}".encode(), digest_size=8
+    ).hexdigest()
+    return f'W/"{version}-{variant}"'
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    # If-None-Match uses weak comparison: W/"x" and "x" match each other
+    if not header:
+        return False
+    opaque = etag.removeprefix("W/")
+    return any(
+        tag.strip() == "*" or tag.strip().removeprefix("W/") == opaque
+        for tag in header.split(",")
+    )
+
+def parse_if_match(header: Optional[str]) -> Optional[List[int]]:
+    """Revisions accepted by an If-Match header; None when any revision will do."""
+    if header is None or header.strip() == "*":
+        return None
+    revisions = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        try:
+            revisions.append(int(tag.strip('"')))
+        except ValueError:
+            continue
+    return revisions
+
+@api_router.post("/tasks", response_model=Task)
+async def create_task(
+    task: TaskCreate,
+    response: Response,
+    current_user: dict = Depends(get_current_user)
+):
+    task_doc = new_task_doc(task, current_user["email"])
     
+    await storage.insert_task(task_doc)
+    await record_task_write(current_user["email"], {
+        "status": {task.status: 1},
+        "priority": {task.priority: 1},
+    }, upserted=[str(task_doc["_id"])])
+    
+    response.headers["ETag"] = task_etag(task_doc)
     return Task(**task_doc)
 
+# ---- bulk operations: a handful of round trips per request, not per item ----
+def bulk_result(results: List[BulkItemResult], ok_status: str) -> BulkResult:
+    succeeded = sum(1 for result in results if result.status == ok_status)
+    return BulkResult(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+@api_router.post("/tasks/bulk", response_model=BulkResult)
+async def bulk_create_tasks(
+    body: TaskBulkCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    docs = [new_task_doc(task, current_user["email"]) for task in body.tasks]
+    errors = await storage.insert_tasks(docs, ordered=body.ordered)
+
+    # An ordered insert stops at its first error; everything after it was never attempted
+    first_error = min(errors) if errors and body.ordered else None
+    results, counter_changes = [], {}
+    for index, doc in enumerate(docs):
+        if index in errors:
+            results.append(BulkItemResult(index=index, status="error", error=errors[index]))
+        elif first_error is not None and index > first_error:
+            results.append(BulkItemResult(index=index, status="skipped"))
+        else:
+            results.append(BulkItemResult(index=index, id=str(doc["_id"]), status="created"))
+            merge_counts(counter_changes, {
+                "status": {doc["status"]: 1},
+                "priority": {doc["priority"]: 1},
+            })
+
+    await record_task_write(
+        current_user["email"], counter_changes,
+        upserted=[result.id for result in results if result.status == "created"],
+    )
+    return bulk_result(results, "created")
+
+@api_router.put("/tasks/bulk", response_model=BulkResult)
+async def bulk_update_tasks(
+    body: TaskBulkUpdate,
+    current_user: dict = Depends(get_current_user)
+):
+    ids = parse_task_ids([item.id for item in body.updates])
+    current = {
+        task["_id"]: task
+        for task in await storage.find_tasks(
+            current_user["email"], ids, fields=("title", "description", "status", "priority", "revision")
+        )
+    }
+
+    # status/priority before this request, per task touched by it
+    before = {}
+    results, updates, op_indexes = [], [], []
+    stopped = False
+    for index, item in enumerate(body.updates):
+        if stopped:
+            results.append(BulkItemResult(index=index, id=item.id, status="skipped"))
+            continue
+        task = current.get(parse_task_id(item.id))
+        if task is None:
+            results.append(BulkItemResult(index=index, id=item.id, status="not_found"))
+            stopped = body.ordered
+            continue
+
+        update_data = task_update_fields(task, item)
+        before.setdefault(task["_id"], {"status": task["status"], "priority": task["priority"]})
+        # Pinned to the revision read above, so a write that lands in between
+        # turns this item into a conflict instead of being overwritten
+        revision = task.get("revision", 0)
+        # Later items for the same id must see this item's changes
+        task.update(update_data, revision=revision + 1)
+        updates.append((task["_id"], update_data, revision))
+        op_indexes.append(index)
+        results.append(BulkItemResult(index=index, id=str(task["_id"]), status="updated"))
+
+    errors = await storage.update_tasks(current_user["email"], updates, ordered=body.ordered)
+    for index, error in errors.items():
+        result = results[op_indexes[index]]
+        if error == TASK_SKIPPED:
+            result.status = "skipped"
+        elif error == TASK_CONFLICT:
+            result.status, result.error = "conflict", error
+        else:
+            result.status, result.error = "error", error
+    if any(result.status == "error" for result in results):
+        logging.getLogger(__name__).warning(
+            "Bulk update for %s had write errors", current_user["email"]
+        )
+
+    # Count only the writes that were applied: replay them, in order, over
+    # each task's starting values so repeated ids net out correctly
+    after = {task_id: dict(fields) for task_id, fields in before.items()}
+    for (task_id, update_data, _), index in zip(updates, op_indexes):
+        if results[index].status == "updated":
+            after[task_id].update(
+                (field, update_data[field]) for field in ("status", "priority") if field in update_data
+            )
+    counter_changes = {}
+    for task_id, fields in before.items():
+        merge_counts(counter_changes, task_counter_changes(fields, after[task_id]))
+
+    await record_task_write(
+        current_user["email"], counter_changes,
+        upserted=[result.id for result in results if result.status == "updated"],
+    )
+    return bulk_result(results, "updated")
+
+@api_router.delete("/tasks/bulk", response_model=BulkResult)
+async def bulk_delete_tasks(
+    body: TaskBulkDelete,
+    current_user: dict = Depends(get_current_user)
+):
+    found = {
+        task["_id"]: task
+        for task in await storage.delete_tasks(current_user["email"], parse_task_ids(body.ids))
+    }
+
+    results, counter_changes = [], {}
+    for index, task_id in enumerate(body.ids):
+        task = found.pop(parse_task_id(task_id), None)
+        if task is None:
+            results.append(BulkItemResult(index=index, id=task_id, status="not_found"))
+            continue
+        results.append(BulkItemResult(index=index, id=str(task["_id"]), status="deleted"))
+        merge_counts(counter_changes, {
+            "status": {task["status"]: -1},
+            "priority": {task["priority"]: -1},
+        })
+
+    await record_task_write(
+        current_user["email"], counter_changes,
+        deleted=[result.id for result in results if result.status == "deleted"],
+    )
+    return bulk_result(results, "deleted")
+
 @api_router.get("/tasks", response_model=List[Task])
 async def get_tasks(
+    request: Request,
     search: Optional[str] = None,
     status: Optional[str] = None,
     priority: Optional[str] = None,
+    limit: int = Query(TASK_PAGE_MAX_SIZE, ge=1, le=TASK_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    sort: str = "-updated_at",
+    if_none_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
-    query = {"user_email": current_user["email"]}
-    
+    # A point lookup on the version decides 304 before any task is read
+    with span("db_version"):
+        version = await task_collection_version(current_user["email"])
+    etag = task_list_etag(current_user["email"], version, request)
+    # Every write up to ``version`` is already in the list below, so the
+    # version doubles as the cursor for /api/tasks/changes
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache", "X-Sync-Cursor": str(version)}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=cache_headers)
+
+    query, query_words = build_task_query(
+        current_user["email"],
+        search=search,
+        status=status,
+        priority=priority,
+        limit=limit,
+        cursor=cursor,
+        created_after=created_after,
+        created_before=created_before,
+        updated_after=updated_after,
+        updated_before=updated_before,
+        sort=sort,
+    )
+
     if search:
-        query["$or"] = [
-            {"title": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}}
-        ]
-    
-    if status:
-        query["status"] = status
+        if not query_words:
+            return task_list_response([], cache_headers)
+        with span("db_query"):
+            tasks = await storage.list_tasks(query)
+        return task_list_response(rank_search_results(tasks, query_words)[:limit], cache_headers)
+
+    with span("db_query"):
+        tasks = await storage.list_tasks(query)
+
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        cache_headers["X-Next-Cursor"] = encode_task_cursor(tasks[-1], sort)
     
-    if priority:
-        query["priority"] = priority
-    
-    tasks = await db.tasks.find(query, {"_id": 0}).to_list(1000)
-    
-    return [Task(**task) for task in tasks]
+    return task_list_response(tasks, cache_headers)
+
+@api_router.get("/tasks/stats", response_model=TaskStats)
+async def get_task_stats(current_user: dict = Depends(get_current_user)):
+    counters = await storage.get_counters(current_user["email"])
+
+    # Counters that were never reconciled may be missing tasks created before
+    # counters existed, so seed them once from the tasks themselves
+    if counters is None or counters["reconciled_at"] is None:
+        result = await reconcile_task_counters(current_user["email"])
+        return build_task_stats(result["by_status"], result["by_priority"])
+
+    return build_task_stats(counters["status"], counters["priority"])
+
+@api_router.get("/tasks/changes", response_model=TaskChanges)
+async def get_task_changes(
+    since: int = Query(..., ge=0),
+    current_user: dict = Depends(get_current_user)
+):
+    email = current_user["email"]
+    counters = await storage.get_counters(email)
+    if since < (counters or {}).get("changes_floor", 0):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Changes since this cursor were pruned; resync with GET /api/tasks",
+        )
+
+    entries = await storage.list_changes(email, since, CHANGES_PAGE_SIZE + 1)
+    has_more = len(entries) > CHANGES_PAGE_SIZE
+    entries = entries[:CHANGES_PAGE_SIZE]
+
+    # A gap in seq is a write whose version was bumped but whose entry is not
+    # visible yet; stop before it unless it is old enough to be a lost entry
+    cursor, latest = since, {}
+    now = datetime.now(timezone.utc)
+    for entry in entries:
+        at = entry["at"] if entry["at"].tzinfo else entry["at"].replace(tzinfo=timezone.utc)
+        if entry["seq"] != cursor + 1 and (now - at).total_seconds() < CHANGES_GAP_GRACE_SECONDS:
+            has_more = True
+            break
+        for task_id in entry["upserted"]:
+            latest[task_id] = "upserted"
+        for task_id in entry["deleted"]:
+            latest[task_id] = "deleted"
+        cursor = entry["seq"]
+
+    upserted_ids = [task_id for task_id, op in latest.items() if op == "upserted"]
+    tasks = await storage.find_tasks(email, parse_task_ids(upserted_ids))
+    found = {str(task["_id"]) for task in tasks}
+
+    # Upserted tasks that no longer exist were deleted by a later write
+    deleted = [task_id for task_id, op in latest.items() if op == "deleted" or task_id not in found]
+
+    return TaskChanges(
+        cursor=cursor,
+        has_more=has_more,
+        upserted=[Task(**task) for task in tasks],
+        deleted=deleted,
+    )
+
+async def iter_task_events(request: Request, email: str, queue: asyncio.Queue):
+    try:
+        yield "retry: 3000\n\n"
+        last_event_id = request.headers.get("last-event-id")
+        if last_event_id and last_event_id.isdigit():
+            # Reconnecting client: let it catch up through /api/tasks/changes
+            yield format_sse({"type": "resync", "since": int(last_event_id)})
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=TASK_EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        task_events.unsubscribe(email, queue)
+
+@api_router.get("/tasks/events")
+async def task_event_stream(
+    request: Request,
+    access_token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+):
+    # EventSource cannot send headers, so the token may also come as a query parameter
+    token = credentials.credentials if credentials else access_token
+    if not token:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    current_user = await authenticate_token(token)
+
+    queue = task_events.subscribe(current_user["email"])
+    return StreamingResponse(
+        iter_task_events(request, current_user["email"], queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def iter_task_export(email: str, compress: bool):
+    """Yield NDJSON chunks, one per cursor batch, optionally as a single gzip stream."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    lines = []
+
+    async for task in storage.iter_tasks(email, batch_size=EXPORT_BATCH_SIZE):
+        lines.append(Task(**task).model_dump_json())
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            chunk = ("\n".join(lines) + "\n").encode()
+            lines = []
+            yield compressor.compress(chunk) if compressor else chunk
+
+    if lines:
+        chunk = ("\n".join(lines) + "\n").encode()
+        yield compressor.compress(chunk) if compressor else chunk
+    if compressor:
+        yield compressor.flush()
+
+@api_router.get("/tasks/export")
+async def export_tasks(
+    gzip: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    headers = {"Content-Disposition": 'attachment; filename="tasks.ndjson"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(
+        iter_task_export(current_user["email"], compress=gzip),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
 
 @api_router.get("/tasks/{task_id}", response_model=Task)
 async def get_task(
     task_id: str,
+    response: Response,
     current_user: dict = Depends(get_current_user)
 ):
-    task = await db.tasks.find_one(
-        {"id": task_id, "user_email": current_user["email"]},
-        {"_id": 0}
-    )
+    task = await storage.get_task(current_user["email"], parse_task_id(task_id))
     
     if not task:
         raise HTTPException(
@@ -637,43 +2100,70 @@ async def get_task(
             detail="Task not found"
         )
     
+    response.headers["ETag"] = task_etag(task)
     return Task(**task)
 
 @api_router.put("/tasks/{task_id}", response_model=Task)
 async def update_task(
     task_id: str,
     task_update: TaskUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
-    # Check if task exists and belongs to user
-    task = await db.tasks.find_one(
-        {"id": task_id, "user_email": current_user["email"]}
-    )
-    
-    if not task:
+    email = current_user["email"]
+    task_id_value = parse_task_id(task_id)
+    expected = parse_if_match(if_match)
+    # Search terms cover title and description together, so changing only
+    # one of them needs the other's current value: read it, then pin the write
+    # to the revision that was read
+    partial_text = (task_update.title is None) != (task_update.description is None)
+
+    before = None
+    for _ in range(3):
+        revisions = expected
+
+        task = {}
+        if partial_text:
+            task = await storage.get_task(email, task_id_value, fields=("title", "description", "revision"))
+            # Tasks written before revisions existed have no field, which counts as 0
+            if task is None or (expected is not None and task.get("revision", 0) not in expected):
+                break
+            revisions = [task.get("revision", 0)]
+
+        update_data = task_update_fields(task, task_update)
+        before = await storage.update_task(email, task_id_value, update_data, revisions)
+        if before is not None or not partial_text or expected is not None:
+            break
+        # Lost a race with another writer between the read and the write; retry
+
+    if before is None:
+        exists = await storage.get_task(email, task_id_value, fields=())
+        if exists and expected is not None:
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail="Task has been modified",
+            )
+        if exists:
+            # Every retry lost a race with another writer; the task is still there
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Task is being modified concurrently, please retry",
+            )
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Task not found"
         )
-    
-    update_data = {"updated_at": datetime.now(timezone.utc).isoformat()}
-    
-    if task_update.title is not None:
-        update_data["title"] = task_update.title
-    if task_update.description is not None:
-        update_data["description"] = task_update.description
-    if task_update.status is not None:
-        update_data["status"] = task_update.status
-    if task_update.priority is not None:
-        update_data["priority"] = task_update.priority
-    
-    await db.tasks.update_one(
-        {"id": task_id},
-        {"$set": update_data}
+
+    # The write replaced exactly these fields, so the new state is known without another read
+    updated_task = {**before, **update_data, "revision": before.get("revision", 0) + 1}
+    updated_task.pop("search_terms", None)
+
+    await record_task_write(
+        email, task_counter_changes(before, update_data), upserted=[str(before["_id"])]
     )
     
-    updated_task = await db.tasks.find_one({"id": task_id}, {"_id": 0})
-    
+    response.headers["ETag"] = task_etag(updated_task)
     return Task(**updated_task)
 
 @api_router.delete("/tasks/{task_id}")
@@ -681,18 +2171,304 @@ async def delete_task(
     task_id: str,
     current_user: dict = Depends(get_current_user)
 ):
-    result = await db.tasks.delete_one(
-        {"id": task_id, "user_email": current_user["email"]}
-    )
+    deleted = await storage.delete_task(current_user["email"], parse_task_id(task_id))
     
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Task not found"
         )
+
+    await record_task_write(current_user["email"], {
+        "status": {deleted["status"]: -1},
+        "priority": {deleted["priority"]: -1},
+    }, deleted=[str(deleted["_id"])])
     
     return {"message": "Task deleted successfully"}
 
+# ================= HEALTH =================
+@app.get("/health/live")
+async def health_live():
+    """The process is up and serving; says nothing about the database."""
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def health_ready():
+    """Whether this worker should get traffic: the database answers a ping in
+    time and, on Mongo, the connection pool is not exhausted."""
+    pool = storage.stats().get("pool")
+    if pool is not None and pool["saturation"] >= HEALTH_MAX_POOL_SATURATION:
+        return not_ready("connection pool exhausted")
+
+    try:
+        await asyncio.wait_for(storage.ping(), HEALTH_PING_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return not_ready("ping timed out")
+    except Exception as exc:
+        logging.getLogger(__name__).warning("Readiness ping failed: %r", exc)
+        return not_ready("ping failed")
+
+    return {"status": "ready", "storage": storage.stats()}
+
+def not_ready(reason: str) -> JSONResponse:
+    return JSONResponse(
+        {"status": "unavailable", "reason": reason, "storage": storage.stats()},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+# ================= METRICS =================
+class HTTPMetrics:
+    """Request counts, in-flight gauges and latency histograms per route template.
+
+    Kept per process: with several workers, Prometheus scrapes each one.
+    """
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        # (method, route) -> requests being handled
+        self.in_flight: Dict[Tuple[str, str], int] = {}
+        # (method, route, status) -> [count per bucket..., +Inf], sum of seconds
+        self.histograms: Dict[Tuple[str, str, str], list] = {}
+        self.sums: Dict[Tuple[str, str, str], float] = {}
+
+    def started(self, method: str, route: str) -> None:
+        with self._lock:
+            key = (method, route)
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def finished(self, method: str, route: str, status_code: int, seconds: float) -> None:
+        key = (method, route, str(status_code))
+        with self._lock:
+            self.in_flight[(method, route)] -= 1
+            counts = self.histograms.get(key)
+            if counts is None:
+                counts = self.histograms[key] = [0] * (len(self.buckets) + 1)
+                self.sums[key] = 0.0
+            counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.sums[key] += seconds
+
+    def render(self) -> List[str]:
+        with self._lock:
+            in_flight = dict(self.in_flight)
+            histograms = {key: list(counts) for key, counts in self.histograms.items()}
+            sums = dict(self.sums)
+
+        lines = [
+            "# HELP http_requests_total Requests handled, by route template and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, code), counts in sorted(histograms.items()):
+            labels = metric_labels(method=method, route=route, status=code)
+            lines.append(f"http_requests_total{labels} {sum(counts)}")
+
+        lines += [
+            "# HELP http_requests_in_flight Requests currently being handled.",
+            "# TYPE http_requests_in_flight gauge",
+        ]
+        for (method, route), count in sorted(in_flight.items()):
+            lines.append(f"http_requests_in_flight{metric_labels(method=method, route=route)} {count}")
+
+        lines += [
+            "# HELP http_request_duration_seconds Time from request start to the end of the response (to its start on streaming routes).",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route, code), counts in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip([*map(format_metric_value, self.buckets), "+Inf"], counts):
+                cumulative += count
+                labels = metric_labels(method=method, route=route, status=code, le=bound)
+                lines.append(f"http_request_duration_seconds_bucket{labels} {cumulative}")
+            labels = metric_labels(method=method, route=route, status=code)
+            lines.append(f"http_request_duration_seconds_sum{labels} {format_metric_value(sums[(method, route, code)])}")
+            lines.append(f"http_request_duration_seconds_count{labels} {cumulative}")
+        return lines
+
+http_metrics = HTTPMetrics(METRICS_LATENCY_BUCKETS)
+
+def format_metric_value(value: float) -> str:
+    return repr(float(value))
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def metric_labels(**labels: str) -> str:
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+def route_template(routes, scope) -> str:
+    """The path the matching route was declared with, so /api/tasks/<id> is one series."""
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    # Unmatched paths share one label so scanners cannot blow up the series count
+    return partial or "<unmatched>"
+
+# Long-lived responses: timed to the start of the response, not its end, so
+# an hours-long event stream neither skews the histogram nor stays in flight
+STREAMING_ROUTES = frozenset({"/api/tasks/events", "/api/tasks/export"})
+
+class HTTPMetricsMiddleware:
+    """Plain ASGI middleware, so streamed responses are not buffered to be timed."""
+
+    def __init__(self, app, metrics: HTTPMetrics, routes, streaming_routes=frozenset()):
+        self.app = app
+        self.metrics = metrics
+        self.routes = routes
+        self.streaming_routes = streaming_routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method, route = scope["method"], route_template(self.routes, scope)
+        streaming = route in self.streaming_routes
+        status_code = 500
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if not finished:
+                finished = True
+                self.metrics.finished(method, route, status_code, time.perf_counter() - start)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if streaming:
+                    finish()
+            await send(message)
+
+        self.metrics.started(method, route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            finish()
+
+def span_metric_lines() -> List[str]:
+    lines = [
+        "# HELP request_phase_duration_seconds Time spent in each timed phase of request handling.",
+        "# TYPE request_phase_duration_seconds summary",
+    ]
+    for phase, (count, seconds) in sorted(span_totals.items()):
+        labels = metric_labels(phase=phase)
+        lines.append(f"request_phase_duration_seconds_sum{labels} {format_metric_value(seconds)}")
+        lines.append(f"request_phase_duration_seconds_count{labels} {count}")
+    return lines
+
+def storage_metric_lines() -> List[str]:
+    """Mongo connection pool and per-command latency from Storage.stats()."""
+    pool = storage.stats().get("pool")
+    if pool is None:
+        return []
+    lines = []
+    for name, help_text in (
+        ("connections", "Open connections."),
+        ("checked_out", "Connections checked out by operations."),
+        ("waiting", "Operations waiting to check out a connection."),
+        ("saturation", "Share of maxPoolSize checked out."),
+    ):
+        lines += [
+            f"# HELP mongo_pool_{name} {help_text}",
+            f"# TYPE mongo_pool_{name} gauge",
+            f"mongo_pool_{name} {format_metric_value(pool[name])}",
+        ]
+    checkout = pool["checkout"]
+    lines += [
+        "# HELP mongo_pool_checkout_wait_seconds Time spent waiting for a pooled connection.",
+        "# TYPE mongo_pool_checkout_wait_seconds summary",
+        f"mongo_pool_checkout_wait_seconds_sum {format_metric_value(checkout['total_seconds'])}",
+        f"mongo_pool_checkout_wait_seconds_count {checkout['count']}",
+        "# HELP mongo_command_duration_seconds Server round trip per command name.",
+        "# TYPE mongo_command_duration_seconds summary",
+    ]
+    for command, stats in sorted(pool["commands"].items()):
+        labels = metric_labels(command=command)
+        lines.append(f"mongo_command_duration_seconds_sum{labels} {format_metric_value(stats['total_seconds'])}")
+        lines.append(f"mongo_command_duration_seconds_count{labels} {stats['count']}")
+    return lines
+
+def cache_metric_lines() -> List[str]:
+    """Hit, miss, eviction and size counts for the in-process TTL caches."""
+    caches = {"user": user_cache.stats(), "token_version": token_versions.stats()}
+    lines = []
+    for name, kind, help_text in (
+        ("hits", "counter", "Lookups answered from the cache."),
+        ("misses", "counter", "Lookups that were absent or expired."),
+        ("evictions", "counter", "Entries dropped to stay within max_size."),
+        ("size", "gauge", "Entries currently held."),
+    ):
+        metric = f"cache_{name}_total" if kind == "counter" else f"cache_{name}"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        for cache, stats in caches.items():
+            lines.append(f"{metric}{metric_labels(cache=cache)} {stats[name]}")
+    return lines
+
+def password_hash_metric_lines() -> List[str]:
+    """Executor occupancy and latency of the bcrypt hash/verify pool."""
+    stats = password_hasher.stats()
+    lines = []
+    for name, help_text in (
+        ("in_flight", "Hash and verify calls submitted and not yet finished."),
+        ("queue_depth", "Calls waiting for a free executor worker."),
+    ):
+        lines += [
+            f"# HELP password_hash_{name} {help_text}",
+            f"# TYPE password_hash_{name} gauge",
+            f"password_hash_{name} {stats[name]}",
+        ]
+    lines += [
+        "# HELP password_hash_rejected_total Calls refused because the queue was full.",
+        "# TYPE password_hash_rejected_total counter",
+        f"password_hash_rejected_total {stats['rejected']}",
+        "# HELP password_hash_duration_seconds Time from submission to result, per operation.",
+        "# TYPE password_hash_duration_seconds summary",
+    ]
+    for op, latency in sorted(stats["latency"].items()):
+        labels = metric_labels(op=op)
+        lines.append(f"password_hash_duration_seconds_sum{labels} {format_metric_value(latency['total_seconds'])}")
+        lines.append(f"password_hash_duration_seconds_count{labels} {latency['count']}")
+    return lines
+
+def login_admission_metric_lines() -> List[str]:
+    """Logins admitted and shed before reaching bcrypt, by reason."""
+    stats = login_admission.stats()
+    lines = [
+        "# HELP login_admitted_total Logins that passed the rate limits.",
+        "# TYPE login_admitted_total counter",
+        f"login_admitted_total {stats['admitted']}",
+        "# HELP login_verifications_in_flight Password verifications currently running.",
+        "# TYPE login_verifications_in_flight gauge",
+        f"login_verifications_in_flight {stats['verifications_in_flight']}",
+        "# HELP login_hashes_shed_total Logins turned away without a password verification.",
+        "# TYPE login_hashes_shed_total counter",
+        f"login_hashes_shed_total {stats['hashes_shed']}",
+        "# HELP login_shed_total Logins turned away, per reason.",
+        "# TYPE login_shed_total counter",
+    ]
+    for reason, count in sorted(stats["shed"].items()):
+        lines.append(f"login_shed_total{metric_labels(reason=reason)} {count}")
+    return lines
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition format."""
+    lines = (
+        http_metrics.render()
+        + span_metric_lines()
+        + cache_metric_lines()
+        + password_hash_metric_lines()
+        + login_admission_metric_lines()
+        + storage_metric_lines()
+    )
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 # ================= ROUTES =================
 app.include_router(api_router)
 
@@ -703,11 +2479,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "ETag", "X-Access-Token", "X-Next-Cursor", "X-Sync-Cursor", "Server-Timing", "X-Profile-File",
+    ],
+)
+app.add_middleware(ProfilingMiddleware)
+# Added last so it is outermost and times CORS handling too
+app.add_middleware(
+    HTTPMetricsMiddleware, metrics=http_metrics, routes=app.router.routes, streaming_routes=STREAMING_ROUTES
 )
 
 # ================= LOGGING =================
 logging.basicConfig(level=logging.INFO)
 
+@app.on_event("startup")
+async def startup_db_client():
+    await storage.ensure_indexes()
+    await revocation_list.load()
+    await task_events.start()
+    app.state.revocation_sync = asyncio.create_task(sync_revocations_forever())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    sync_task = getattr(app.state, "revocation_sync", None)
+    if sync_task is not None:
+        sync_task.cancel()
+    await task_events.stop()
+    await storage.close()
+    password_hasher.shutdown()
\ No newline at end of file
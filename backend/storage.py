@@ -0,0 +1,1565 @@
+"""Persistence for users, tasks, task counters, the task change log and
+revoked tokens.
+
+``Storage`` is the interface the API is written against. Three backends
+implement it, selected by ``STORAGE_BACKEND``:
+
+- ``mongo``: the production backend (Motor).
+- ``memory``: process-local dictionaries, for tests and benchmarks.
+- ``sqlite``: a single file in WAL mode, for small single-node deployments.
+
+Every backend hands back documents in the same shape: tasks carry ``_id``
+(a ``uuid.UUID``) plus ``TASK_FIELDS``, with datetimes in UTC (Mongo
+returns them naive). tests/test_storage.py is the contract every backend
+must pass.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+# Keep in step with the Task model in server.py (its ``id`` is ``_id`` here)
+TASK_FIELDS = ("title", "description", "status", "priority", "user_email", "created_at", "updated_at", "revision")
+
+# Each sort walks one of the user_email/<field>/_id indexes, forwards or backwards
+TASK_SORTS = {
+    "-updated_at": ("updated_at", DESCENDING),
+    "updated_at": ("updated_at", ASCENDING),
+    "-created_at": ("created_at", DESCENDING),
+    "created_at": ("created_at", ASCENDING),
+}
+
+
+@dataclass
+class TaskQuery:
+    """One page of a user's tasks: filters, order and keyset position."""
+    user_email: str
+    status: Optional[str] = None
+    priority: Optional[str] = None
+    # Every term must be one of the task's search_terms
+    terms: List[str] = field(default_factory=list)
+    # Half-open date ranges: *_after is inclusive, *_before exclusive
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    updated_after: Optional[datetime] = None
+    updated_before: Optional[datetime] = None
+    sort: str = "-updated_at"
+    # (sort field value, _id) of the last task on the previous page
+    after: Optional[Tuple[datetime, uuid.UUID]] = None
+    limit: Optional[int] = None
+
+    def ranges(self) -> List[Tuple[str, str, datetime]]:
+        bounds = (
+            ("created_at", "$gte", self.created_after),
+            ("created_at", "$lt", self.created_before),
+            ("updated_at", "$gte", self.updated_after),
+            ("updated_at", "$lt", self.updated_before),
+        )
+        return [(name, op, value) for name, op, value in bounds if value is not None]
+
+
+class Storage(ABC):
+    """The persistence operations the API needs.
+
+    Task writes that touch counters go through ``record_write``, which bumps
+    the user's version and appends one change-log entry numbered by it.
+    """
+
+    # Whether watch_changes can stream writes made by other processes
+    can_watch_changes = False
+
+    @abstractmethod
+    async def ensure_indexes(self) -> dict:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    async def ping(self) -> None:
+        """Round trip to the backing store; raises if it cannot serve requests."""
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__}
+
+    # ---- users ----
+    @abstractmethod
+    async def get_user(self, email: str, include_password: bool = False) -> Optional[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_user(self, user: dict) -> bool:
+        """Insert ``user``; False when the email is already registered."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_user(self, email: str, changes: dict) -> Optional[dict]:
+        """Apply ``changes``, bump token_version and return the updated user (no password)."""
+        raise NotImplementedError
+
+    # ---- revoked tokens ----
+    @abstractmethod
+    async def revoke_token(self, jti: str, expires_at: datetime, revoked_at: datetime) -> bool:
+        """Record ``jti`` as revoked; False if it already was, so each token is revoked once."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def is_token_revoked(self, jti: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def revoked_token_ids(
+        self, expires_after: Optional[datetime] = None, revoked_since: Optional[datetime] = None
+    ) -> List[str]:
+        raise NotImplementedError
+
+    # ---- tasks ----
+    @abstractmethod
+    async def insert_tasks(self, tasks: List[dict], ordered: bool = True) -> Dict[int, str]:
+        """Insert ``tasks``; returns error messages by index (an ordered insert stops at the first)."""
+        raise NotImplementedError
+
+    async def insert_task(self, task: dict) -> None:
+        errors = await self.insert_tasks([task])
+        if errors:
+            raise RuntimeError(errors[0])
+
+    @abstractmethod
+    async def get_task(self, email: str, task_id: Optional[uuid.UUID], fields: Optional[Iterable[str]] = None) -> Optional[dict]:
+        """One task, or None. ``fields`` limits the fields returned besides ``_id``."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_tasks(self, email: str, task_ids: Iterable[uuid.UUID], fields: Optional[Iterable[str]] = None) -> List[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_tasks(self, query: TaskQuery) -> List[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_tasks(self, email: str, sort: str = "-updated_at", batch_size: int = 500) -> AsyncIterator[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_task(
+        self, email: str, task_id: Optional[uuid.UUID], changes: dict, revisions: Optional[List[int]] = None
+    ) -> Optional[dict]:
+        """Set ``changes`` and bump the revision, only if the stored revision is one of
+        ``revisions`` (None accepts any). Returns the task as it was before, or None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_tasks(
+        self, email: str, updates: List[Tuple[uuid.UUID, dict, int]], ordered: bool = True
+    ) -> Dict[int, str]:
+        """Apply many ``(task_id, changes, revision)`` updates, each only if the task
+        is still at ``revision``. Returns, by index, why an update was not applied:
+        TASK_CONFLICT, TASK_SKIPPED (after a write error when ``ordered``) or an
+        error message. Once an update to a task fails, later ones to it conflict."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_task(self, email: str, task_id: Optional[uuid.UUID]) -> Optional[dict]:
+        """Delete one task and return it, or None if there was none."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_tasks(self, email: str, task_ids: Iterable[uuid.UUID]) -> List[dict]:
+        """Delete the given tasks and return the ones this call removed; tasks
+        removed by an overlapping delete are not returned twice."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count_tasks(self, email: str) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Exact counts straight from the tasks: (by_status, by_priority)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def task_owners(self) -> List[str]:
+        """Every email that has tasks or counters."""
+        raise NotImplementedError
+
+    # ---- counters and change log ----
+    @abstractmethod
+    async def record_write(
+        self, email: str, changes: Dict[str, Dict[str, int]], upserted: List[str], deleted: List[str], at: datetime
+    ) -> dict:
+        """Apply counter deltas, bump the version and append the change entry it numbers."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_version(self, email: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_counters(self, email: str) -> Optional[dict]:
+        """``{"version", "status", "priority", "reconciled_at", "changes_floor"}`` or None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_counts(
+        self, email: str, by_status: Dict[str, int], by_priority: Dict[str, int], reconciled_at: datetime,
+        version: int,
+    ) -> bool:
+        """Overwrite the counts only if the counters are still at ``version``; returns whether they were."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_changes(self, email: str, since: int, limit: int) -> List[dict]:
+        """Change entries with seq > ``since`` in seq order."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def prune_changes(self, cutoff: datetime) -> Tuple[int, int]:
+        """Drop entries older than ``cutoff`` after raising each user's changes_floor
+        to the newest dropped seq. Returns (entries deleted, users affected)."""
+        raise NotImplementedError
+
+    def watch_changes(self, resume_after: Optional[dict] = None) -> AsyncIterator[Tuple[Optional[dict], dict]]:
+        """``(entry, resume_token)`` for change entries as they are appended by any
+        process, continuing after ``resume_after`` when given. The first item,
+        with entry None, is yielded once the stream is open."""
+        raise NotImplementedError(f"{type(self).__name__} cannot watch for changes")
+
+
+# Reasons update_tasks gives for updates it did not apply
+TASK_CONFLICT = "Task has been modified"
+TASK_SKIPPED = "Not attempted after an earlier write error"
+
+
+def as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def merge_counts(total: Dict[str, Dict[str, int]], changes: Dict[str, Dict[str, int]]) -> None:
+    for name, deltas in changes.items():
+        for value, delta in deltas.items():
+            total.setdefault(name, {})
+            total[name][value] = total[name].get(value, 0) + delta
+
+
+# ================= MONGO =================
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "tasks": [
+        IndexModel(
+            [("user_email", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_email_updated_at__id",
+        ),
+        IndexModel(
+            [("user_email", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_email_created_at__id",
+        ),
+        IndexModel([("user_email", ASCENDING), ("search_terms", ASCENDING)], name="user_email_search_terms"),
+        IndexModel(
+            [("user_email", ASCENDING), ("status", ASCENDING),
+             ("priority", ASCENDING), ("updated_at", DESCENDING)],
+            name="user_email_status_priority_updated_at",
+        ),
+    ],
+    "task_counters": [
+        IndexModel([("user_email", ASCENDING)], name="user_email_unique", unique=True),
+    ],
+    "task_changes": [
+        IndexModel([("user_email", ASCENDING), ("seq", ASCENDING)], name="user_email_seq_unique", unique=True),
+        IndexModel([("at", ASCENDING)], name="at"),
+    ],
+    "revoked_tokens": [
+        IndexModel([("jti", ASCENDING)], name="jti_unique", unique=True),
+        # Mongo drops each entry once the token it revokes has expired anyway
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+TASK_PROJECTION = {"_id": 1, **{name: 1 for name in TASK_FIELDS}}
+
+# find_one_and_delete calls a bulk delete keeps in flight at once
+MONGO_DELETE_CONCURRENCY = 50
+
+
+def counter_key(value: str) -> str:
+    # Mongo field names cannot contain "." or start with "$"
+    return value.replace("$", "\uff04").replace(".", "\uff0e")
+
+
+def counter_value(key: str) -> str:
+    return key.replace("\uff04", "$").replace("\uff0e", ".")
+
+
+def read_counter_field(doc: Optional[dict], name: str) -> Dict[str, int]:
+    return {
+        counter_value(key): count
+        for key, count in ((doc or {}).get(name) or {}).items()
+        if count
+    }
+
+
+def revision_filter(revisions: List[int]) -> dict:
+    # Tasks written before revisions existed have no field, which counts as 0
+    return {"$in": [None, *revisions] if 0 in revisions else revisions}
+
+
+def task_sort_spec(sort: str) -> List[Tuple[str, int]]:
+    name, direction = TASK_SORTS[sort]
+    return [(name, direction), ("_id", direction)]
+
+
+def task_filter(query: TaskQuery) -> dict:
+    """The Mongo filter for ``query``; every shape it produces has a matching index."""
+    selector = {"user_email": query.user_email}
+    if query.terms:
+        selector["search_terms"] = {"$all": list(dict.fromkeys(query.terms))}
+    if query.status:
+        selector["status"] = query.status
+    if query.priority:
+        selector["priority"] = query.priority
+    for name, op, value in query.ranges():
+        selector.setdefault(name, {})[op] = value
+    if query.after is not None:
+        name, direction = TASK_SORTS[query.sort]
+        beyond = "$lt" if direction == DESCENDING else "$gt"
+        value, task_id = query.after
+        selector["$or"] = [
+            {name: {beyond: value}},
+            {name: value, "_id": {beyond: task_id}},
+        ]
+    return selector
+
+
+def latency_stats() -> dict:
+    return {"count": 0, "failures": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+
+def record_latency(stats: dict, seconds: float, failed: bool = False) -> None:
+    stats["count"] += 1
+    stats["failures"] += failed
+    stats["total_seconds"] += seconds
+    stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+
+class MongoMonitor(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    """Connection pool and command timings from pymongo's event hooks.
+
+    Callbacks run on Motor's worker threads. A checkout starts and ends on the
+    same thread, so the wait for a connection is timed per thread.
+    """
+
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.connections = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.max_checked_out = 0
+        self.checkout = latency_stats()
+        self.checkout_failures: Dict[str, int] = {}
+        self.pool_clears = 0
+        self.commands: Dict[str, dict] = {}
+
+    # ---- commands ----
+    def started(self, event):
+        pass
+
+    def _command_done(self, event, failed: bool) -> None:
+        with self._lock:
+            stats = self.commands.setdefault(event.command_name, latency_stats())
+            record_latency(stats, event.duration_micros / 1e6, failed)
+
+    def succeeded(self, event):
+        self._command_done(event, failed=False)
+
+    def failed(self, event):
+        self._command_done(event, failed=True)
+
+    # ---- pool ----
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections -= 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+
+    def _checkout_done(self, failed: bool) -> None:
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        with self._lock:
+            self.waiting = max(0, self.waiting - 1)
+            if started is not None:
+                record_latency(self.checkout, time.perf_counter() - started, failed)
+
+    def connection_check_out_failed(self, event):
+        self._checkout_done(failed=True)
+        with self._lock:
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        self._checkout_done(failed=False)
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def saturation(self) -> float:
+        """Share of the pool checked out right now; 1.0 means new operations queue."""
+        return self.checked_out / self.max_pool_size if self.max_pool_size else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_pool_size": self.max_pool_size,
+                "connections": self.connections,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "waiting": self.waiting,
+                "saturation": self.saturation(),
+                "checkout": dict(self.checkout),
+                "checkout_failures": dict(self.checkout_failures),
+                "pool_clears": self.pool_clears,
+                "commands": {name: dict(stats) for name, stats in self.commands.items()},
+            }
+
+
+class MongoStorage(Storage):
+    # Change streams need a replica set; watch_changes fails on a standalone server
+    can_watch_changes = True
+
+    def __init__(self, client, db_name: str, monitor: Optional[MongoMonitor] = None):
+        self.client = client
+        self.db = client[db_name]
+        self.monitor = monitor
+
+    def _projection(self, fields: Optional[Iterable[str]]) -> dict:
+        return TASK_PROJECTION if fields is None else {"_id": 1, **{name: 1 for name in fields}}
+
+    async def ensure_indexes(self) -> dict:
+        """Create every index in INDEXES; safe to run concurrently from many workers."""
+        created = {}
+        for collection, models in INDEXES.items():
+            try:
+                created[collection] = await self.db[collection].create_indexes(models)
+            except OperationFailure as exc:
+                # e.g. an index with the same name but different options already exists
+                logging.getLogger(__name__).error(
+                    "Could not ensure indexes on %s: %s", collection, exc
+                )
+                created[collection] = []
+        return created
+
+    async def index_usage(self) -> dict:
+        """Per-collection index access counts ($indexStats) and sizes (collStats)."""
+        report = {}
+        for collection in INDEXES:
+            sizes = (await self.db.command("collStats", collection)).get("indexSizes", {})
+            stats = await self.db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+            report[collection] = [
+                {
+                    "name": stat["name"],
+                    "key": dict(stat["key"]),
+                    "ops": stat["accesses"]["ops"],
+                    "since": stat["accesses"]["since"],
+                    "size_bytes": sizes.get(stat["name"], 0),
+                }
+                for stat in stats
+            ]
+        return report
+
+    async def close(self) -> None:
+        self.client.close()
+
+    async def ping(self):
+        await self.db.command("ping")
+
+    def stats(self):
+        stats = super().stats()
+        if self.monitor is not None:
+            stats["pool"] = self.monitor.stats()
+        return stats
+
+    async def get_user(self, email, include_password=False):
+        projection = {"_id": 0} if include_password else {"_id": 0, "password": 0}
+        return await self.db.users.find_one({"email": email}, projection)
+
+    async def create_user(self, user):
+        try:
+            # insert_one adds _id to the document it is given
+            await self.db.users.insert_one(dict(user))
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def update_user(self, email, changes):
+        return await self.db.users.find_one_and_update(
+            {"email": email},
+            {"$set": changes, "$inc": {"token_version": 1}},
+            projection={"_id": 0, "password": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def revoke_token(self, jti, expires_at, revoked_at):
+        try:
+            result = await self.db.revoked_tokens.update_one(
+                {"jti": jti},
+                {"$setOnInsert": {"jti": jti, "expires_at": expires_at, "revoked_at": revoked_at}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # A concurrent upsert of the same jti won the unique index
+            return False
+        return result.upserted_id is not None
+
+    async def is_token_revoked(self, jti):
+        return await self.db.revoked_tokens.find_one({"jti": jti}, {"_id": 1}) is not None
+
+    async def revoked_token_ids(self, expires_after=None, revoked_since=None):
+        selector = {}
+        if expires_after is not None:
+            selector["expires_at"] = {"$gt": expires_after}
+        if revoked_since is not None:
+            selector["revoked_at"] = {"$gte": revoked_since}
+        return [doc["jti"] async for doc in self.db.revoked_tokens.find(selector, {"_id": 0, "jti": 1})]
+
+    async def insert_tasks(self, tasks, ordered=True):
+        if not tasks:
+            return {}
+        try:
+            await self.db.tasks.insert_many(tasks, ordered=ordered)
+        except BulkWriteError as exc:
+            return {err["index"]: err.get("errmsg", "write error") for err in exc.details["writeErrors"]}
+        return {}
+
+    async def get_task(self, email, task_id, fields=None):
+        return await self.db.tasks.find_one({"_id": task_id, "user_email": email}, self._projection(fields))
+
+    async def find_tasks(self, email, task_ids, fields=None):
+        task_ids = list(task_ids)
+        if not task_ids:
+            return []
+        return await self.db.tasks.find(
+            {"user_email": email, "_id": {"$in": task_ids}}, self._projection(fields)
+        ).to_list(None)
+
+    async def list_tasks(self, query):
+        cursor = self.db.tasks.find(task_filter(query), TASK_PROJECTION).sort(task_sort_spec(query.sort))
+        if query.limit is not None:
+            cursor = cursor.limit(query.limit)
+        return await cursor.to_list(query.limit)
+
+    async def iter_tasks(self, email, sort="-updated_at", batch_size=500):
+        cursor = self.db.tasks.find({"user_email": email}, TASK_PROJECTION).sort(task_sort_spec(sort))
+        async for task in cursor.batch_size(batch_size):
+            yield task
+
+    async def update_task(self, email, task_id, changes, revisions=None):
+        selector = {"_id": task_id, "user_email": email}
+        if revisions is not None:
+            selector["revision"] = revision_filter(revisions)
+        return await self.db.tasks.find_one_and_update(
+            selector,
+            {"$set": changes, "$inc": {"revision": 1}},
+            projection=TASK_PROJECTION,
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    async def update_tasks(self, email, updates, ordered=True):
+        # One bulk write per wave, each holding at most one update per task, so
+        # repeated ids apply in order even when the server reorders unordered writes
+        waves: List[List[int]] = []
+        occurrences: Dict[uuid.UUID, int] = {}
+        for index, (task_id, _, _) in enumerate(updates):
+            wave = occurrences.get(task_id, 0)
+            occurrences[task_id] = wave + 1
+            if wave == len(waves):
+                waves.append([])
+            waves[wave].append(index)
+
+        errors: Dict[int, str] = {}
+        failed_ids = set()
+        stopped = False
+        for wave in waves:
+            if stopped:
+                errors.update({index: TASK_SKIPPED for index in wave})
+                continue
+            indexes = []
+            for index in wave:
+                if updates[index][0] in failed_ids:
+                    errors[index] = TASK_CONFLICT
+                else:
+                    indexes.append(index)
+            if not indexes:
+                continue
+
+            # Marks the documents this wave changed, in case some updates conflict
+            marker = uuid.uuid4().hex
+            operations = [
+                UpdateOne(
+                    {"_id": updates[index][0], "user_email": email, "revision": revision_filter([updates[index][2]])},
+                    {"$set": {**updates[index][1], "bulk_write_id": marker}, "$inc": {"revision": 1}},
+                )
+                for index in indexes
+            ]
+            write_errors: Dict[int, str] = {}
+            try:
+                result = await self.db.tasks.bulk_write(operations, ordered=ordered)
+                matched = result.matched_count
+            except BulkWriteError as exc:
+                write_errors = {
+                    indexes[err["index"]]: err.get("errmsg", "write error") for err in exc.details["writeErrors"]
+                }
+                matched = exc.details["nMatched"]
+
+            attempted = indexes
+            if ordered and write_errors:
+                # An ordered bulk write stops at its first error
+                stop = indexes.index(min(write_errors))
+                attempted = indexes[:stop]
+                errors.update({index: TASK_SKIPPED for index in indexes[stop + 1:]})
+                stopped = True
+            errors.update(write_errors)
+            written = [index for index in attempted if index not in write_errors]
+            if matched < len(written):
+                applied = {
+                    task["_id"]
+                    for task in await self.db.tasks.find(
+                        {"_id": {"$in": [updates[index][0] for index in written]}, "bulk_write_id": marker},
+                        {"_id": 1},
+                    ).to_list(None)
+                }
+                errors.update({index: TASK_CONFLICT for index in written if updates[index][0] not in applied})
+            failed_ids.update(updates[index][0] for index in indexes if index in errors)
+        return errors
+
+    async def delete_task(self, email, task_id):
+        return await self.db.tasks.find_one_and_delete(
+            {"_id": task_id, "user_email": email}, projection=TASK_PROJECTION
+        )
+
+    async def delete_tasks(self, email, task_ids):
+        # One find_one_and_delete per id returns exactly what this call removed;
+        # a find then delete_many would hand overlapping deletes the same tasks
+        task_ids = list(dict.fromkeys(task_ids))
+        deleted = []
+        for start in range(0, len(task_ids), MONGO_DELETE_CONCURRENCY):
+            batch = task_ids[start:start + MONGO_DELETE_CONCURRENCY]
+            for task in await asyncio.gather(*(self.delete_task(email, task_id) for task_id in batch)):
+                if task is not None:
+                    deleted.append(task)
+        return deleted
+
+    async def count_tasks(self, email):
+        groups = await self.db.tasks.aggregate([
+            {"$match": {"user_email": email}},
+            {"$group": {"_id": {"status": "$status", "priority": "$priority"}, "count": {"$sum": 1}}},
+        ]).to_list(None)
+
+        by_status: Dict[str, int] = {}
+        by_priority: Dict[str, int] = {}
+        for group in groups:
+            key, count = group["_id"], group["count"]
+            by_status[key["status"]] = by_status.get(key["status"], 0) + count
+            by_priority[key["priority"]] = by_priority.get(key["priority"], 0) + count
+        return by_status, by_priority
+
+    async def task_owners(self):
+        emails = set(await self.db.tasks.distinct("user_email"))
+        emails |= set(await self.db.task_counters.distinct("user_email"))
+        return sorted(emails)
+
+    async def record_write(self, email, changes, upserted, deleted, at):
+        inc = {
+            f"{name}.{counter_key(value)}": delta
+            for name, deltas in changes.items()
+            for value, delta in deltas.items()
+            if delta
+        }
+        inc["version"] = 1
+        counters = await self.db.task_counters.find_one_and_update(
+            {"user_email": email},
+            {"$inc": inc},
+            projection={"_id": 0, "version": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        entry = {
+            "user_email": email,
+            "seq": counters["version"],
+            "upserted": list(upserted),
+            "deleted": list(deleted),
+            "at": at,
+        }
+        # insert_one adds _id to the document it is given
+        await self.db.task_changes.insert_one(dict(entry))
+        return entry
+
+    async def get_version(self, email):
+        counters = await self.db.task_counters.find_one({"user_email": email}, {"_id": 0, "version": 1})
+        return (counters or {}).get("version", 0)
+
+    async def get_counters(self, email):
+        doc = await self.db.task_counters.find_one({"user_email": email}, {"_id": 0})
+        if doc is None:
+            return None
+        return {
+            "version": doc.get("version", 0),
+            "status": read_counter_field(doc, "status"),
+            "priority": read_counter_field(doc, "priority"),
+            "reconciled_at": doc.get("reconciled_at"),
+            "changes_floor": doc.get("changes_floor", 0),
+        }
+
+    async def set_counts(self, email, by_status, by_priority, reconciled_at, version):
+        # A missing version field reads as 0. Only version 0 may create the
+        # document, and that upsert loses to a concurrent insert on the unique index
+        try:
+            result = await self.db.task_counters.update_one(
+                {"user_email": email, "version": version or {"$in": [0, None]}},
+                {"$set": {
+                    "status": {counter_key(k): v for k, v in by_status.items()},
+                    "priority": {counter_key(k): v for k, v in by_priority.items()},
+                    "reconciled_at": reconciled_at,
+                }},
+                upsert=not version,
+            )
+        except DuplicateKeyError:
+            return False
+        return bool(result.matched_count or result.upserted_id)
+
+    async def list_changes(self, email, since, limit):
+        return await self.db.task_changes.find(
+            {"user_email": email, "seq": {"$gt": since}}, {"_id": 0}
+        ).sort("seq", ASCENDING).limit(limit).to_list(limit)
+
+    async def prune_changes(self, cutoff):
+        floors = await self.db.task_changes.aggregate([
+            {"$match": {"at": {"$lt": cutoff}}},
+            {"$group": {"_id": "$user_email", "seq": {"$max": "$seq"}}},
+        ]).to_list(None)
+        # Record the floor first so clients behind it get 410 instead of a silent gap
+        for floor in floors:
+            await self.db.task_counters.update_one(
+                {"user_email": floor["_id"]},
+                {"$max": {"changes_floor": floor["seq"]}},
+                upsert=True,
+            )
+        result = await self.db.task_changes.delete_many({"at": {"$lt": cutoff}})
+        return result.deleted_count, len(floors)
+
+    async def watch_changes(self, resume_after=None):
+        # Needs a replica set; the caller reconnects on errors
+        async with self.db.task_changes.watch(
+            [{"$match": {"operationType": "insert"}}], resume_after=resume_after
+        ) as stream:
+            yield None, stream.resume_token
+            async for change in stream:
+                yield change["fullDocument"], change["_id"]
+
+
+# ================= MEMORY =================
+class MemoryStorage(Storage):
+    """Everything in dictionaries of this process. Methods never await in the
+    middle of a change, so each one is atomic on the event loop."""
+
+    def __init__(self):
+        self.users: Dict[str, dict] = {}
+        self.tasks: Dict[str, Dict[uuid.UUID, dict]] = {}
+        self.task_ids: set = set()
+        self.counters: Dict[str, dict] = {}
+        self.changes: Dict[str, List[dict]] = {}
+        self.revoked: Dict[str, dict] = {}
+
+    def _task_out(self, task: dict, fields: Optional[Iterable[str]] = None) -> dict:
+        names = TASK_FIELDS if fields is None else fields
+        return {"_id": task["_id"], **{name: task[name] for name in names if name in task}}
+
+    def _user_tasks(self, email: str) -> Dict[uuid.UUID, dict]:
+        return self.tasks.get(email, {})
+
+    async def ensure_indexes(self):
+        return {}
+
+    async def get_user(self, email, include_password=False):
+        user = self.users.get(email)
+        if user is None:
+            return None
+        return dict(user) if include_password else {k: v for k, v in user.items() if k != "password"}
+
+    async def create_user(self, user):
+        if user["email"] in self.users:
+            return False
+        self.users[user["email"]] = dict(user)
+        return True
+
+    async def update_user(self, email, changes):
+        user = self.users.get(email)
+        if user is None:
+            return None
+        user.update(changes)
+        user["token_version"] = user.get("token_version", 0) + 1
+        return await self.get_user(email)
+
+    async def revoke_token(self, jti, expires_at, revoked_at):
+        if jti in self.revoked:
+            return False
+        self.revoked[jti] = {"expires_at": as_utc(expires_at), "revoked_at": as_utc(revoked_at)}
+        return True
+
+    async def is_token_revoked(self, jti):
+        return jti in self.revoked
+
+    async def revoked_token_ids(self, expires_after=None, revoked_since=None):
+        if expires_after is not None:
+            # Stands in for Mongo's TTL index
+            self.revoked = {
+                jti: entry for jti, entry in self.revoked.items() if entry["expires_at"] > as_utc(expires_after)
+            }
+        return [
+            jti for jti, entry in self.revoked.items()
+            if revoked_since is None or entry["revoked_at"] >= as_utc(revoked_since)
+        ]
+
+    async def insert_tasks(self, tasks, ordered=True):
+        errors = {}
+        for index, task in enumerate(tasks):
+            if task["_id"] in self.task_ids:
+                errors[index] = f"duplicate key: {task['_id']}"
+                if ordered:
+                    break
+                continue
+            self.task_ids.add(task["_id"])
+            self.tasks.setdefault(task["user_email"], {})[task["_id"]] = {
+                **task, "created_at": as_utc(task["created_at"]), "updated_at": as_utc(task["updated_at"]),
+            }
+        return errors
+
+    async def get_task(self, email, task_id, fields=None):
+        task = self._user_tasks(email).get(task_id)
+        return None if task is None else self._task_out(task, fields)
+
+    async def find_tasks(self, email, task_ids, fields=None):
+        owned = self._user_tasks(email)
+        return [self._task_out(owned[task_id], fields) for task_id in dict.fromkeys(task_ids) if task_id in owned]
+
+    def _matches(self, task: dict, query: TaskQuery) -> bool:
+        if query.status and task["status"] != query.status:
+            return False
+        if query.priority and task["priority"] != query.priority:
+            return False
+        if query.terms and not set(query.terms) <= set(task.get("search_terms", ())):
+            return False
+        for name, op, value in query.ranges():
+            if op == "$gte" and not task[name] >= as_utc(value):
+                return False
+            if op == "$lt" and not task[name] < as_utc(value):
+                return False
+        if query.after is not None:
+            name, direction = TASK_SORTS[query.sort]
+            key, after = (task[name], task["_id"]), (as_utc(query.after[0]), query.after[1])
+            if (key >= after) if direction == DESCENDING else (key <= after):
+                return False
+        return True
+
+    def _sorted(self, tasks: Iterable[dict], sort: str) -> List[dict]:
+        name, direction = TASK_SORTS[sort]
+        return sorted(tasks, key=lambda task: (task[name], task["_id"]), reverse=direction == DESCENDING)
+
+    async def list_tasks(self, query):
+        matched = [task for task in self._user_tasks(query.user_email).values() if self._matches(task, query)]
+        ordered = self._sorted(matched, query.sort)
+        if query.limit is not None:
+            ordered = ordered[:query.limit]
+        return [self._task_out(task) for task in ordered]
+
+    async def iter_tasks(self, email, sort="-updated_at", batch_size=500):
+        for task in self._sorted(list(self._user_tasks(email).values()), sort):
+            yield self._task_out(task)
+
+    async def update_task(self, email, task_id, changes, revisions=None):
+        task = self._user_tasks(email).get(task_id)
+        if task is None or (revisions is not None and task.get("revision", 0) not in revisions):
+            return None
+        before = self._task_out(task)
+        task.update(changes)
+        task["revision"] = task.get("revision", 0) + 1
+        return before
+
+    async def update_tasks(self, email, updates, ordered=True):
+        errors = {}
+        failed_ids = set()
+        for index, (task_id, changes, revision) in enumerate(updates):
+            if task_id in failed_ids or await self.update_task(email, task_id, changes, [revision]) is None:
+                errors[index] = TASK_CONFLICT
+                failed_ids.add(task_id)
+        return errors
+
+    async def delete_task(self, email, task_id):
+        task = self._user_tasks(email).pop(task_id, None)
+        if task is None:
+            return None
+        self.task_ids.discard(task_id)
+        return self._task_out(task)
+
+    async def delete_tasks(self, email, task_ids):
+        deleted = []
+        for task_id in dict.fromkeys(task_ids):
+            task = await self.delete_task(email, task_id)
+            if task is not None:
+                deleted.append(task)
+        return deleted
+
+    async def count_tasks(self, email):
+        by_status: Dict[str, int] = {}
+        by_priority: Dict[str, int] = {}
+        for task in self._user_tasks(email).values():
+            by_status[task["status"]] = by_status.get(task["status"], 0) + 1
+            by_priority[task["priority"]] = by_priority.get(task["priority"], 0) + 1
+        return by_status, by_priority
+
+    async def task_owners(self):
+        return sorted({email for email, tasks in self.tasks.items() if tasks} | set(self.counters))
+
+    async def record_write(self, email, changes, upserted, deleted, at):
+        counters = self.counters.setdefault(email, {"version": 0, "status": {}, "priority": {}, "changes_floor": 0})
+        merge_counts(counters, changes)
+        counters["version"] += 1
+        entry = {
+            "user_email": email,
+            "seq": counters["version"],
+            "upserted": list(upserted),
+            "deleted": list(deleted),
+            "at": as_utc(at),
+        }
+        self.changes.setdefault(email, []).append(entry)
+        return dict(entry)
+
+    async def get_version(self, email):
+        return self.counters.get(email, {}).get("version", 0)
+
+    async def get_counters(self, email):
+        counters = self.counters.get(email)
+        if counters is None:
+            return None
+        return {
+            "version": counters["version"],
+            "status": {k: v for k, v in counters["status"].items() if v},
+            "priority": {k: v for k, v in counters["priority"].items() if v},
+            "reconciled_at": counters.get("reconciled_at"),
+            "changes_floor": counters["changes_floor"],
+        }
+
+    async def set_counts(self, email, by_status, by_priority, reconciled_at, version):
+        if self.counters.get(email, {}).get("version", 0) != version:
+            return False
+        counters = self.counters.setdefault(email, {"version": 0, "changes_floor": 0})
+        counters.update(status=dict(by_status), priority=dict(by_priority), reconciled_at=as_utc(reconciled_at))
+        return True
+
+    async def list_changes(self, email, since, limit):
+        # Entries are appended in seq order
+        return [dict(entry) for entry in self.changes.get(email, []) if entry["seq"] > since][:limit]
+
+    async def prune_changes(self, cutoff):
+        cutoff = as_utc(cutoff)
+        deleted = users = 0
+        for email, entries in self.changes.items():
+            old = [entry for entry in entries if entry["at"] < cutoff]
+            if not old:
+                continue
+            counters = self.counters.setdefault(email, {"version": 0, "status": {}, "priority": {}, "changes_floor": 0})
+            counters["changes_floor"] = max(counters["changes_floor"], max(entry["seq"] for entry in old))
+            self.changes[email] = [entry for entry in entries if entry["at"] >= cutoff]
+            deleted += len(old)
+            users += 1
+        return deleted, users
+
+
+# ================= SQLITE =================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    password TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    token_version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS tasks (
+    id BLOB PRIMARY KEY,
+    user_email TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT,
+    status TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tasks_user_email_updated_at_id ON tasks (user_email, updated_at, id);
+CREATE INDEX IF NOT EXISTS tasks_user_email_created_at_id ON tasks (user_email, created_at, id);
+CREATE INDEX IF NOT EXISTS tasks_user_email_status_priority_updated_at
+    ON tasks (user_email, status, priority, updated_at);
+
+CREATE TABLE IF NOT EXISTS task_terms (
+    user_email TEXT NOT NULL,
+    term TEXT NOT NULL,
+    task_id BLOB NOT NULL,
+    PRIMARY KEY (user_email, term, task_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS task_terms_task_id ON task_terms (task_id);
+
+CREATE TABLE IF NOT EXISTS task_counters (
+    user_email TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    reconciled_at INTEGER,
+    changes_floor INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS task_counts (
+    user_email TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_email, field, value)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS task_changes (
+    user_email TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    upserted TEXT NOT NULL,
+    deleted TEXT NOT NULL,
+    at INTEGER NOT NULL,
+    PRIMARY KEY (user_email, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS task_changes_at ON task_changes (at);
+
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    jti TEXT PRIMARY KEY,
+    expires_at INTEGER NOT NULL,
+    revoked_at INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS revoked_tokens_revoked_at ON revoked_tokens (revoked_at);
+CREATE INDEX IF NOT EXISTS revoked_tokens_expires_at ON revoked_tokens (expires_at);
+"""
+
+SQLITE_TASK_COLUMNS = "id, " + ", ".join(TASK_FIELDS)
+# Columns an update may set; search_terms lives in task_terms
+SQLITE_UPDATABLE = {"title", "description", "status", "priority", "updated_at", "search_terms"}
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_millis(value: datetime) -> int:
+    return (as_utc(value) - EPOCH) // timedelta(milliseconds=1)
+
+
+def from_millis(value: Optional[int]) -> Optional[datetime]:
+    return None if value is None else EPOCH + timedelta(milliseconds=value)
+
+
+class SQLiteStorage(Storage):
+    """One SQLite file in WAL mode. All statements run on a single worker
+    thread, so each method's transaction is applied without interleaving."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SQLITE_SCHEMA)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _task_out(self, row: sqlite3.Row, fields: Optional[Iterable[str]] = None) -> dict:
+        task = {
+            "_id": uuid.UUID(bytes=row["id"]),
+            "title": row["title"],
+            "description": row["description"],
+            "status": row["status"],
+            "priority": row["priority"],
+            "user_email": row["user_email"],
+            "created_at": from_millis(row["created_at"]),
+            "updated_at": from_millis(row["updated_at"]),
+            "revision": row["revision"],
+        }
+        return task if fields is None else {"_id": task["_id"], **{name: task[name] for name in fields}}
+
+    def _set_terms(self, email: str, task_id: bytes, terms: Iterable[str]) -> None:
+        self._conn.execute("DELETE FROM task_terms WHERE task_id = ?", (task_id,))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO task_terms (user_email, term, task_id) VALUES (?, ?, ?)",
+            [(email, term, task_id) for term in terms],
+        )
+
+    async def ensure_indexes(self):
+        def run():
+            self._conn.executescript(SQLITE_SCHEMA)
+            rows = self._conn.execute(
+                "SELECT tbl_name, name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+            ).fetchall()
+            created = {}
+            for row in rows:
+                created.setdefault(row["tbl_name"], []).append(row["name"])
+            return created
+        return await self._run(run)
+
+    async def close(self):
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=False)
+
+    async def ping(self):
+        # Queues behind every statement already waiting for the worker thread
+        await self._run(lambda: self._conn.execute("SELECT 1").fetchone())
+
+    # ---- users ----
+    async def get_user(self, email, include_password=False):
+        def run():
+            row = self._conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+            if row is None:
+                return None
+            user = dict(row)
+            if not include_password:
+                del user["password"]
+            return user
+        return await self._run(run)
+
+    async def create_user(self, user):
+        def run():
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT INTO users (email, name, password, created_at, token_version) VALUES (?, ?, ?, ?, ?)",
+                        (user["email"], user["name"], user["password"], user["created_at"], user.get("token_version", 0)),
+                    )
+            except sqlite3.IntegrityError:
+                return False
+            return True
+        return await self._run(run)
+
+    async def update_user(self, email, changes):
+        unknown = set(changes) - {"name", "password"}
+        if unknown:
+            raise ValueError(f"cannot update user fields {sorted(unknown)}")
+
+        def run():
+            with self._conn:
+                assignments = "".join(f"{name} = ?, " for name in changes)
+                cursor = self._conn.execute(
+                    f"UPDATE users SET {assignments}token_version = token_version + 1 WHERE email = ?",
+                    (*changes.values(), email),
+                )
+            if cursor.rowcount == 0:
+                return None
+            row = self._conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+            return {k: row[k] for k in row.keys() if k != "password"}
+        return await self._run(run)
+
+    # ---- revoked tokens ----
+    async def revoke_token(self, jti, expires_at, revoked_at):
+        def run():
+            with self._conn:
+                return self._conn.execute(
+                    "INSERT OR IGNORE INTO revoked_tokens (jti, expires_at, revoked_at) VALUES (?, ?, ?)",
+                    (jti, to_millis(expires_at), to_millis(revoked_at)),
+                ).rowcount == 1
+        return await self._run(run)
+
+    async def is_token_revoked(self, jti):
+        def run():
+            return self._conn.execute("SELECT 1 FROM revoked_tokens WHERE jti = ?", (jti,)).fetchone() is not None
+        return await self._run(run)
+
+    async def revoked_token_ids(self, expires_after=None, revoked_since=None):
+        def run():
+            clauses, params = [], []
+            if expires_after is not None:
+                # Stands in for Mongo's TTL index
+                with self._conn:
+                    self._conn.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (to_millis(expires_after),))
+            if revoked_since is not None:
+                clauses.append("revoked_at >= ?")
+                params.append(to_millis(revoked_since))
+            where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+            return [row["jti"] for row in self._conn.execute(f"SELECT jti FROM revoked_tokens{where}", params)]
+        return await self._run(run)
+
+    # ---- tasks ----
+    async def insert_tasks(self, tasks, ordered=True):
+        def run():
+            errors = {}
+            with self._conn:
+                for index, task in enumerate(tasks):
+                    task_id = task["_id"].bytes
+                    try:
+                        self._conn.execute(
+                            f"INSERT INTO tasks ({SQLITE_TASK_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (
+                                task_id, task["title"], task.get("description"), task["status"],
+                                task["priority"], task["user_email"], to_millis(task["created_at"]),
+                                to_millis(task["updated_at"]), task.get("revision", 0),
+                            ),
+                        )
+                    except sqlite3.IntegrityError as exc:
+                        errors[index] = str(exc)
+                        if ordered:
+                            break
+                        continue
+                    self._set_terms(task["user_email"], task_id, task.get("search_terms", ()))
+            return errors
+        return await self._run(run)
+
+    async def get_task(self, email, task_id, fields=None):
+        if task_id is None:
+            return None
+
+        def run():
+            row = self._conn.execute(
+                f"SELECT {SQLITE_TASK_COLUMNS} FROM tasks WHERE id = ? AND user_email = ?",
+                (task_id.bytes, email),
+            ).fetchone()
+            return None if row is None else self._task_out(row, fields)
+        return await self._run(run)
+
+    async def find_tasks(self, email, task_ids, fields=None):
+        task_ids = [task_id.bytes for task_id in dict.fromkeys(task_ids)]
+        if not task_ids:
+            return []
+
+        def run():
+            placeholders = ", ".join("?" * len(task_ids))
+            rows = self._conn.execute(
+                f"SELECT {SQLITE_TASK_COLUMNS} FROM tasks WHERE user_email = ? AND id IN ({placeholders})",
+                (email, *task_ids),
+            ).fetchall()
+            return [self._task_out(row, fields) for row in rows]
+        return await self._run(run)
+
+    def _select(self, query: TaskQuery) -> Tuple[str, list]:
+        """SELECT for ``query``; the WHERE/ORDER BY pairs match the task indexes."""
+        clauses, params = ["user_email = ?"], [query.user_email]
+        if query.status:
+            clauses.append("status = ?")
+            params.append(query.status)
+        if query.priority:
+            clauses.append("priority = ?")
+            params.append(query.priority)
+        for name, op, value in query.ranges():
+            clauses.append(f"{name} {'>=' if op == '$gte' else '<'} ?")
+            params.append(to_millis(value))
+        terms = list(dict.fromkeys(query.terms))
+        if terms:
+            clauses.append(
+                "id IN (SELECT task_id FROM task_terms WHERE user_email = ? AND term IN "
+                f"({', '.join('?' * len(terms))}) GROUP BY task_id HAVING COUNT(*) = ?)"
+            )
+            params.extend([query.user_email, *terms, len(terms)])
+        name, direction = TASK_SORTS[query.sort]
+        order = "DESC" if direction == DESCENDING else "ASC"
+        if query.after is not None:
+            clauses.append(f"({name}, id) {'<' if direction == DESCENDING else '>'} (?, ?)")
+            params.extend([to_millis(query.after[0]), query.after[1].bytes])
+        sql = (
+            f"SELECT {SQLITE_TASK_COLUMNS} FROM tasks WHERE {' AND '.join(clauses)} "
+            f"ORDER BY {name} {order}, id {order}"
+        )
+        if query.limit is not None:
+            sql += " LIMIT ?"
+            params.append(query.limit)
+        return sql, params
+
+    async def list_tasks(self, query):
+        sql, params = self._select(query)
+
+        def run():
+            return [self._task_out(row) for row in self._conn.execute(sql, params)]
+        return await self._run(run)
+
+    async def iter_tasks(self, email, sort="-updated_at", batch_size=500):
+        query = TaskQuery(user_email=email, sort=sort, limit=batch_size)
+        while True:
+            batch = await self.list_tasks(query)
+            for task in batch:
+                yield task
+            if len(batch) < batch_size:
+                return
+            name, _ = TASK_SORTS[sort]
+            query.after = (batch[-1][name], batch[-1]["_id"])
+
+    def _update(self, email: str, task_id: bytes, changes: dict) -> None:
+        unknown = set(changes) - SQLITE_UPDATABLE
+        if unknown:
+            raise ValueError(f"cannot update task fields {sorted(unknown)}")
+        columns = {name: value for name, value in changes.items() if name != "search_terms"}
+        if "updated_at" in columns:
+            columns["updated_at"] = to_millis(columns["updated_at"])
+        assignments = "".join(f"{name} = ?, " for name in columns)
+        self._conn.execute(
+            f"UPDATE tasks SET {assignments}revision = revision + 1 WHERE id = ? AND user_email = ?",
+            (*columns.values(), task_id, email),
+        )
+        if "search_terms" in changes:
+            self._set_terms(email, task_id, changes["search_terms"])
+
+    async def update_task(self, email, task_id, changes, revisions=None):
+        if task_id is None:
+            return None
+
+        def run():
+            with self._conn:
+                row = self._conn.execute(
+                    f"SELECT {SQLITE_TASK_COLUMNS} FROM tasks WHERE id = ? AND user_email = ?",
+                    (task_id.bytes, email),
+                ).fetchone()
+                if row is None or (revisions is not None and row["revision"] not in revisions):
+                    return None
+                self._update(email, task_id.bytes, changes)
+            return self._task_out(row)
+        return await self._run(run)
+
+    async def update_tasks(self, email, updates, ordered=True):
+        def run():
+            errors = {}
+            failed_ids = set()
+            with self._conn:
+                for index, (task_id, changes, revision) in enumerate(updates):
+                    row = self._conn.execute(
+                        "SELECT revision FROM tasks WHERE id = ? AND user_email = ?", (task_id.bytes, email)
+                    ).fetchone()
+                    if task_id in failed_ids or row is None or row["revision"] != revision:
+                        errors[index] = TASK_CONFLICT
+                        failed_ids.add(task_id)
+                        continue
+                    try:
+                        self._update(email, task_id.bytes, changes)
+                    except (sqlite3.Error, ValueError) as exc:
+                        errors[index] = str(exc)
+                        failed_ids.add(task_id)
+                        if ordered:
+                            errors.update({later: TASK_SKIPPED for later in range(index + 1, len(updates))})
+                            break
+            return errors
+        return await self._run(run)
+
+    async def delete_task(self, email, task_id):
+        deleted = await self.delete_tasks(email, [task_id] if task_id is not None else [])
+        return deleted[0] if deleted else None
+
+    async def delete_tasks(self, email, task_ids):
+        task_ids = [task_id.bytes for task_id in dict.fromkeys(task_ids)]
+        if not task_ids:
+            return []
+
+        def run():
+            placeholders = ", ".join("?" * len(task_ids))
+            with self._conn:
+                rows = self._conn.execute(
+                    f"SELECT {SQLITE_TASK_COLUMNS} FROM tasks WHERE user_email = ? AND id IN ({placeholders})",
+                    (email, *task_ids),
+                ).fetchall()
+                found = [row["id"] for row in rows]
+                if found:
+                    found_placeholders = ", ".join("?" * len(found))
+                    self._conn.execute(f"DELETE FROM tasks WHERE id IN ({found_placeholders})", found)
+                    self._conn.execute(f"DELETE FROM task_terms WHERE task_id IN ({found_placeholders})", found)
+            return [self._task_out(row) for row in rows]
+        return await self._run(run)
+
+    async def count_tasks(self, email):
+        def run():
+            by_status: Dict[str, int] = {}
+            by_priority: Dict[str, int] = {}
+            rows = self._conn.execute(
+                "SELECT status, priority, COUNT(*) AS count FROM tasks WHERE user_email = ? GROUP BY status, priority",
+                (email,),
+            )
+            for row in rows:
+                by_status[row["status"]] = by_status.get(row["status"], 0) + row["count"]
+                by_priority[row["priority"]] = by_priority.get(row["priority"], 0) + row["count"]
+            return by_status, by_priority
+        return await self._run(run)
+
+    async def task_owners(self):
+        def run():
+            rows = self._conn.execute(
+                "SELECT user_email FROM tasks UNION SELECT user_email FROM task_counters ORDER BY user_email"
+            )
+            return [row["user_email"] for row in rows]
+        return await self._run(run)
+
+    # ---- counters and change log ----
+    async def record_write(self, email, changes, upserted, deleted, at):
+        entry = {
+            "user_email": email,
+            "upserted": list(upserted),
+            "deleted": list(deleted),
+            "at": as_utc(at),
+        }
+
+        def run():
+            with self._conn:
+                entry["seq"] = self._conn.execute(
+                    "INSERT INTO task_counters (user_email, version) VALUES (?, 1) "
+                    "ON CONFLICT (user_email) DO UPDATE SET version = version + 1 RETURNING version",
+                    (email,),
+                ).fetchone()["version"]
+                self._conn.executemany(
+                    "INSERT INTO task_counts (user_email, field, value, count) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (user_email, field, value) DO UPDATE SET count = count + excluded.count",
+                    [
+                        (email, name, value, delta)
+                        for name, deltas in changes.items()
+                        for value, delta in deltas.items()
+                        if delta
+                    ],
+                )
+                self._conn.execute(
+                    "INSERT INTO task_changes (user_email, seq, upserted, deleted, at) VALUES (?, ?, ?, ?, ?)",
+                    (email, entry["seq"], json.dumps(entry["upserted"]), json.dumps(entry["deleted"]), to_millis(at)),
+                )
+            return entry
+        return await self._run(run)
+
+    async def get_version(self, email):
+        def run():
+            row = self._conn.execute("SELECT version FROM task_counters WHERE user_email = ?", (email,)).fetchone()
+            return 0 if row is None else row["version"]
+        return await self._run(run)
+
+    async def get_counters(self, email):
+        def run():
+            row = self._conn.execute("SELECT * FROM task_counters WHERE user_email = ?", (email,)).fetchone()
+            if row is None:
+                return None
+            counters = {
+                "version": row["version"],
+                "status": {},
+                "priority": {},
+                "reconciled_at": from_millis(row["reconciled_at"]),
+                "changes_floor": row["changes_floor"],
+            }
+            counts = self._conn.execute(
+                "SELECT field, value, count FROM task_counts WHERE user_email = ? AND count != 0", (email,)
+            )
+            for count in counts:
+                counters.setdefault(count["field"], {})[count["value"]] = count["count"]
+            return counters
+        return await self._run(run)
+
+    async def set_counts(self, email, by_status, by_priority, reconciled_at, version):
+        def run():
+            with self._conn:
+                row = self._conn.execute(
+                    "INSERT INTO task_counters (user_email, reconciled_at) VALUES (?, ?) "
+                    "ON CONFLICT (user_email) DO UPDATE SET reconciled_at = excluded.reconciled_at "
+                    "WHERE task_counters.version = ? RETURNING version",
+                    (email, to_millis(reconciled_at), version),
+                ).fetchone()
+                # No row: the update's WHERE failed. A fresh insert is at version 0
+                if row is None or row["version"] != version:
+                    self._conn.rollback()
+                    return False
+                self._conn.execute("DELETE FROM task_counts WHERE user_email = ?", (email,))
+                self._conn.executemany(
+                    "INSERT INTO task_counts (user_email, field, value, count) VALUES (?, ?, ?, ?)",
+                    [(email, "status", k, v) for k, v in by_status.items()]
+                    + [(email, "priority", k, v) for k, v in by_priority.items()],
+                )
+            return True
+        return await self._run(run)
+
+    async def list_changes(self, email, since, limit):
+        def run():
+            rows = self._conn.execute(
+                "SELECT * FROM task_changes WHERE user_email = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (email, since, limit),
+            )
+            return [
+                {
+                    "user_email": row["user_email"],
+                    "seq": row["seq"],
+                    "upserted": json.loads(row["upserted"]),
+                    "deleted": json.loads(row["deleted"]),
+                    "at": from_millis(row["at"]),
+                }
+                for row in rows
+            ]
+        return await self._run(run)
+
+    async def prune_changes(self, cutoff):
+        def run():
+            with self._conn:
+                floors = self._conn.execute(
+                    "SELECT user_email, MAX(seq) AS seq FROM task_changes WHERE at < ? GROUP BY user_email",
+                    (to_millis(cutoff),),
+                ).fetchall()
+                self._conn.executemany(
+                    "INSERT INTO task_counters (user_email, changes_floor) VALUES (?, ?) "
+                    "ON CONFLICT (user_email) DO UPDATE SET changes_floor = MAX(changes_floor, excluded.changes_floor)",
+                    [(row["user_email"], row["seq"]) for row in floors],
+                )
+                cursor = self._conn.execute("DELETE FROM task_changes WHERE at < ?", (to_millis(cutoff),))
+            return cursor.rowcount, len(floors)
+        return await self._run(run)
+
+
+def create_storage(
+    backend: str, mongo_url: str, db_name: str, sqlite_path: str, mongo_options: Optional[dict] = None
+) -> Storage:
+    """``mongo_options`` are passed to AsyncIOMotorClient (pool size, timeouts, read preference)."""
+    if backend == "mongo":
+        options = dict(mongo_options or {})
+        monitor = MongoMonitor(options.get("maxPoolSize", 100))
+        client = AsyncIOMotorClient(
+            mongo_url,
+            # Task ids are uuid.UUID values stored as BSON binary subtype 4
+            uuidRepresentation="standard",
+            event_listeners=[monitor],
+            **options,
+        )
+        return MongoStorage(client, db_name, monitor)
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_path)
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; expected mongo, memory or sqlite")
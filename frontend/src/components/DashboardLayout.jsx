@@ -40,7 +40,12 @@ const DashboardLayout = ({ children }) => {
     };
 
     const handleLogout = () => {
+        const refreshToken = localStorage.getItem('refresh_token');
+        if (refreshToken) {
+            api.post('/auth/logout', { refresh_token: refreshToken }).catch(() => {});
+        }
         localStorage.removeItem('token');
+        localStorage.removeItem('refresh_token');
         localStorage.removeItem('user');
         toast.success('Logged out successfully');
         navigate('/login');
@@ -4,38 +4,38 @@ import { FiTrendingUp, FiCheckCircle, FiClock, FiAlertCircle, FiBarChart2, FiPie
 import api from '../utils/api.js';
 
 const Analytics = () => {
-    const [tasks, setTasks] = useState([]);
+    const [taskStats, setTaskStats] = useState(null);
     const [loading, setLoading] = useState(true);
 
     useEffect(() => {
-        loadTasks();
+        loadStats();
     }, []);
 
-    const loadTasks = async () => {
+    const loadStats = async () => {
         try {
             setLoading(true);
-            const response = await api.get('/tasks');
-            setTasks(response.data);
+            const response = await api.get('/tasks/stats');
+            setTaskStats(response.data);
         } catch (error) {
-            console.error('Failed to load tasks:', error);
+            console.error('Failed to load task stats:', error);
         } finally {
             setLoading(false);
         }
     };
 
     const stats = {
-        total: tasks.length,
-        completed: tasks.filter(t => t.status === 'completed').length,
-        inProgress: tasks.filter(t => t.status === 'in-progress').length,
-        pending: tasks.filter(t => t.status === 'pending').length,
-        high: tasks.filter(t => t.priority === 'high').length,
-        medium: tasks.filter(t => t.priority === 'medium').length,
-        low: tasks.filter(t => t.priority === 'low').length,
+        total: taskStats?.total ?? 0,
+        completed: taskStats?.by_status?.completed ?? 0,
+        inProgress: taskStats?.by_status?.['in-progress'] ?? 0,
+        pending: taskStats?.by_status?.pending ?? 0,
+        high: taskStats?.by_priority?.high ?? 0,
+        medium: taskStats?.by_priority?.medium ?? 0,
+        low: taskStats?.by_priority?.low ?? 0,
     };
 
-    const completionRate = stats.total > 0 ? ((stats.completed / stats.total) * 100).toFixed(1) : 0;
-    const inProgressRate = stats.total > 0 ? ((stats.inProgress / stats.total) * 100).toFixed(1) : 0;
-    const pendingRate = stats.total > 0 ? ((stats.pending / stats.total) * 100).toFixed(1) : 0;
+    const completionRate = (taskStats?.completion_rate ?? 0).toFixed(1);
+    const inProgressRate = (taskStats?.in_progress_rate ?? 0).toFixed(1);
+    const pendingRate = (taskStats?.pending_rate ?? 0).toFixed(1);
 
     const StatCard = ({ icon: Icon, label, value, subtitle, color, bgColor }) => (
         <motion.div
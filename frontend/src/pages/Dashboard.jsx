@@ -44,6 +44,61 @@ const Dashboard = () => {
     loadTasks();
   }, []);
 
+  useEffect(() => {
+    let source;
+    let retryTimer;
+    let retries = 0;
+    let closed = false;
+
+    const connect = () => {
+      const token = localStorage.getItem('token');
+      if (!token || closed) return;
+      source = new EventSource(`${api.defaults.baseURL}/tasks/events?access_token=${encodeURIComponent(token)}`);
+      source.onopen = () => {
+        // A new stream starts at the present; reload to pick up writes made while disconnected
+        if (retries > 0) loadTasks();
+        retries = 0;
+      };
+      source.addEventListener('tasks', (event) => {
+        const { upserted, deleted } = JSON.parse(event.data);
+        setTasks((current) => {
+          const changed = new Map(upserted.map((task) => [task.id, task]));
+          const removed = new Set(deleted);
+          const merged = current
+            .filter((task) => !removed.has(task.id))
+            .map((task) => changed.get(task.id) || task);
+          const known = new Set(current.map((task) => task.id));
+          const added = upserted.filter((task) => !known.has(task.id));
+          return [...added, ...merged];
+        });
+      });
+      source.addEventListener('resync', () => loadTasks());
+      source.onerror = () => {
+        source.close();
+        retries += 1;
+        retryTimer = setTimeout(reconnect, Math.min(30000, 1000 * 2 ** retries));
+      };
+    };
+
+    const reconnect = async () => {
+      try {
+        // EventSource cannot report a 401; an authenticated request refreshes
+        // an expired token first, or logs out when the refresh token is dead too
+        await api.get('/auth/profile');
+      } catch (error) {
+        if (error.response?.status === 401) return;
+      }
+      connect();
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
+  }, []);
+
   useEffect(() => {
     filterTasks();
   }, [tasks, searchQuery]);
@@ -83,8 +138,15 @@ const Dashboard = () => {
   const loadTasks = async () => {
     try {
       setLoading(true);
-      const response = await api.get('/tasks');
-      setTasks(response.data);
+      // The list is paged; follow the cursor so the board and its stats see every task
+      const loaded = new Map();
+      let cursor = null;
+      do {
+        const response = await api.get('/tasks', { params: cursor ? { cursor } : {} });
+        response.data.forEach((task) => loaded.set(task.id, task));
+        cursor = response.headers['x-next-cursor'];
+      } while (cursor);
+      setTasks([...loaded.values()]);
     } catch (error) {
       console.error('Failed to load tasks:', error);
       toast.error('Failed to load tasks');
@@ -136,7 +198,9 @@ const Dashboard = () => {
     }
 
     try {
-      await api.put(`/tasks/${selectedTask.id}`, taskForm);
+      await api.put(`/tasks/${selectedTask.id}`, taskForm, {
+        headers: { 'If-Match': `"${selectedTask.revision ?? 0}"` },
+      });
       toast.success('Task updated successfully');
       setIsEditDialogOpen(false);
       setSelectedTask(null);
@@ -144,6 +208,13 @@ const Dashboard = () => {
       loadTasks();
     } catch (error) {
       console.error('Failed to update task:', error);
+      if (error.response?.status === 412) {
+        toast.error('This task was changed elsewhere. Reloaded the latest version.');
+        setIsEditDialogOpen(false);
+        setSelectedTask(null);
+        loadTasks();
+        return;
+      }
       toast.error('Failed to update task');
     }
   };
@@ -45,6 +45,7 @@ const Login = () => {
       const response = await api.post('/auth/login', formData);
 
       localStorage.setItem('token', response.data.access_token);
+      localStorage.setItem('refresh_token', response.data.refresh_token);
       localStorage.setItem('user', JSON.stringify(response.data.user));
 
       toast.success('Welcome back!');
@@ -65,6 +65,7 @@ const Register = () => {
       });
 
       localStorage.setItem('token', response.data.access_token);
+      localStorage.setItem('refresh_token', response.data.refresh_token);
       localStorage.setItem('user', JSON.stringify(response.data.user));
 
       toast.success('Account created successfully!');
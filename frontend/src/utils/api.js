@@ -19,12 +19,77 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
-// Auto logout on 401
+// Endpoints that authenticate with credentials or a refresh token, never an access token
+const UNAUTHENTICATED_AUTH_PATHS = ["/auth/login", "/auth/register", "/auth/refresh", "/auth/logout"];
+
+// One refresh at a time: refresh tokens are single-use on the server and
+// every tab shares them through localStorage, so where the browser supports
+// it the refresh also holds a lock that other tabs wait on
+let refreshPromise = null;
+
+const withRefreshLock = (refresh) =>
+  navigator.locks ? navigator.locks.request("taskflow-token-refresh", refresh) : refresh();
+
+const refreshAccessToken = (rejectedToken) => {
+  if (!refreshPromise) {
+    refreshPromise = withRefreshLock(async () => {
+      // Another tab refreshed while this one waited for the lock
+      const currentToken = localStorage.getItem("token");
+      if (currentToken && currentToken !== rejectedToken) {
+        return currentToken;
+      }
+      const response = await axios.post(`${BACKEND_URL}/api/auth/refresh`, {
+        refresh_token: localStorage.getItem("refresh_token"),
+      });
+      localStorage.setItem("token", response.data.access_token);
+      localStorage.setItem("refresh_token", response.data.refresh_token);
+      return response.data.access_token;
+    }).finally(() => {
+      refreshPromise = null;
+    });
+  }
+  return refreshPromise;
+};
+
+// Refresh the access token on 401, logout if that fails too
 api.interceptors.response.use(
-  (response) => response,
-  (error) => {
+  (response) => {
+    // The server rotates the token when profile claims change
+    const refreshedToken = response.headers["x-access-token"];
+    if (refreshedToken) {
+      localStorage.setItem("token", refreshedToken);
+    }
+    return response;
+  },
+  async (error) => {
+    const original = error.config;
+    if (
+      error.response?.status === 401 &&
+      original &&
+      !original._retried &&
+      !UNAUTHENTICATED_AUTH_PATHS.includes(original.url) &&
+      localStorage.getItem("refresh_token")
+    ) {
+      original._retried = true;
+      const rejectedToken = original.headers.Authorization?.replace(/^Bearer /, "");
+      const sentRefreshToken = localStorage.getItem("refresh_token");
+      try {
+        const token = await refreshAccessToken(rejectedToken);
+        original.headers.Authorization = `Bearer ${token}`;
+        return api(original);
+      } catch (refreshError) {
+        // Losing a refresh race to another tab is not a logout: it has already
+        // stored the rotated tokens, so retry with those
+        const latestToken = localStorage.getItem("token");
+        if (localStorage.getItem("refresh_token") !== sentRefreshToken && latestToken) {
+          original.headers.Authorization = `Bearer ${latestToken}`;
+          return api(original);
+        }
+      }
+    }
     if (error.response?.status === 401) {
       localStorage.removeItem("token");
+      localStorage.removeItem("refresh_token");
       localStorage.removeItem("user");
       window.location.href = "/login";
     }
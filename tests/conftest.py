@@ -0,0 +1,32 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend is run from its own directory (uvicorn server:app), not installed
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """The API on a fresh in-memory store, without startup hooks or shared cache state."""
+    from fastapi.testclient import TestClient
+
+    import server
+    from storage import MemoryStorage
+
+    monkeypatch.setattr(server, "storage", MemoryStorage())
+    server.user_cache.clear()
+    server.token_versions.clear()
+    yield TestClient(server.app)
+    server.user_cache.clear()
+    server.token_versions.clear()
+
+
+def register(client, email: str = "owner@example.com") -> dict:
+    """Register ``email`` and return Authorization headers for it."""
+    response = client.post(
+        "/api/auth/register", json={"email": email, "name": "Owner", "password": "secret-password"}
+    )
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
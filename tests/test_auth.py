@@ -0,0 +1,203 @@
+"""Token validation, refresh and admission control, on the in-memory backend."""
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+import server
+from tests.conftest import register
+
+EMAIL = "owner@example.com"
+
+
+def bearer(user: dict) -> dict:
+    token = server.create_access_token(
+        server.user_token_claims(user), timedelta(minutes=server.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+def rename_elsewhere(name: str) -> dict:
+    """A profile update made by another worker: storage changes, local caches do not."""
+    return asyncio.run(server.storage.update_user(EMAIL, {"name": name}))
+
+
+# ---- token versions ----
+def test_token_newer_than_cached_version_is_accepted(client):
+    headers = register(client)
+    assert client.get("/api/auth/profile", headers=headers).status_code == 200
+
+    renamed = rename_elsewhere("Renamed")
+    response = client.get("/api/auth/profile", headers=bearer(renamed))
+    assert response.status_code == 200
+    assert response.json()["name"] == "Renamed"
+    assert server.token_versions.get(EMAIL) == renamed["token_version"]
+
+
+def test_revoked_token_is_rejected_once_the_version_expires(client):
+    headers = register(client)
+    assert client.get("/api/auth/profile", headers=headers).status_code == 200
+
+    rename_elsewhere("Renamed")
+    # The user cache still holds the old version; expiry must not refill from it
+    server.token_versions.clear()
+    response = client.get("/api/auth/profile", headers=headers)
+    assert response.status_code == 401
+
+
+def test_refresh_issues_claims_from_storage(client):
+    tokens = client.post(
+        "/api/auth/register",
+        json={"email": EMAIL, "name": "Owner", "password": "secret-password"},
+    ).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/api/auth/profile", headers=headers).status_code == 200
+
+    rename_elsewhere("Renamed")
+    refreshed = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert refreshed.status_code == 200
+    assert refreshed.json()["user"]["name"] == "Renamed"
+
+    headers = {"Authorization": f"Bearer {refreshed.json()['access_token']}"}
+    assert client.get("/api/auth/profile", headers=headers).json()["name"] == "Renamed"
+
+
+# ---- refresh token rotation ----
+def tokens_for(client) -> dict:
+    response = client.post(
+        "/api/auth/register",
+        json={"email": EMAIL, "name": "Owner", "password": "secret-password"},
+    )
+    return response.json()
+
+
+def test_refresh_token_is_single_use(client):
+    tokens = tokens_for(client)
+    body = {"refresh_token": tokens["refresh_token"]}
+
+    assert client.post("/api/auth/refresh", json=body).status_code == 200
+    assert client.post("/api/auth/refresh", json=body).status_code == 401
+    assert client.post("/api/auth/logout", json=body).status_code == 401
+
+
+def test_refresh_is_single_use_when_the_filter_lags(client, monkeypatch):
+    """Another worker's filter has not synced yet; the storage write still refuses a reuse."""
+    tokens = tokens_for(client)
+    body = {"refresh_token": tokens["refresh_token"]}
+    assert client.post("/api/auth/refresh", json=body).status_code == 200
+
+    monkeypatch.setattr(server.revocation_list, "filter", server.BloomFilter(100, 0.01))
+    response = client.post("/api/auth/refresh", json=body)
+    assert response.status_code == 401
+
+
+def test_concurrent_refreshes_rotate_once(client, monkeypatch):
+    tokens = tokens_for(client)
+    request = server.RefreshRequest(refresh_token=tokens["refresh_token"])
+
+    async def not_yet_revoked(jti):
+        # Both requests get past the check before either revokes
+        await asyncio.sleep(0)
+        return False
+
+    monkeypatch.setattr(server.revocation_list, "is_revoked", not_yet_revoked)
+
+    async def refresh_twice():
+        return await asyncio.gather(
+            server.refresh(request), server.refresh(request), return_exceptions=True
+        )
+
+    results = asyncio.run(refresh_twice())
+    assert sum(isinstance(result, server.Token) for result in results) == 1
+    assert [result.status_code for result in results if isinstance(result, server.HTTPException)] == [401]
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = server.BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"jti-{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    assert bloom.count == 1000
+
+
+def test_bloom_filter_false_positive_rate_is_near_target():
+    bloom = server.BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"jti-{i}")
+
+    false_positives = sum(f"other-{i}" in bloom for i in range(10_000))
+    assert false_positives < 10_000 * 0.03
+    assert "never-added" not in server.BloomFilter(capacity=1000, error_rate=0.01)
+
+
+def test_bloom_filter_sizing():
+    bloom = server.BloomFilter(capacity=1000, error_rate=0.01)
+    # m = -n ln p / (ln 2)^2 and k = m/n ln 2
+    assert bloom.size == 9586
+    assert bloom.hash_count == 7
+    assert len(bloom.bits) == (bloom.size + 7) // 8
+
+
+# ---- login rate limits ----
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def limiter(monkeypatch, **kwargs) -> tuple:
+    clock = Clock()
+    monkeypatch.setattr(server.time, "monotonic", clock)
+    return server.TokenBucketLimiter(**kwargs), clock
+
+
+def test_token_bucket_allows_burst_then_reports_wait(monkeypatch):
+    bucket, _ = limiter(monkeypatch, rate_per_minute=6, burst=3)
+
+    assert [bucket.acquire("ip") for _ in range(3)] == [0.0, 0.0, 0.0]
+    # One token every 10 s at 6 per minute
+    assert bucket.acquire("ip") == 10.0
+    assert bucket.acquire("other") == 0.0
+
+
+def test_token_bucket_refills_over_time(monkeypatch):
+    bucket, clock = limiter(monkeypatch, rate_per_minute=6, burst=2)
+    bucket.acquire("ip")
+    bucket.acquire("ip")
+
+    clock.now += 4
+    assert bucket.acquire("ip") == pytest.approx(6.0)
+    clock.now += 6
+    assert bucket.acquire("ip") == 0.0
+    # Idle time never refills past the burst
+    clock.now += 3600
+    assert [bucket.acquire("ip") for _ in range(3)] == [0.0, 0.0, 10.0]
+
+
+def test_token_bucket_evicts_oldest_keys(monkeypatch):
+    bucket, _ = limiter(monkeypatch, rate_per_minute=6, burst=1, max_keys=2)
+    bucket.acquire("a")
+    bucket.acquire("b")
+    bucket.acquire("a")
+    bucket.acquire("c")
+
+    assert list(bucket._buckets) == ["a", "c"]
+    # "b" starts again with a full bucket
+    assert bucket.acquire("b") == 0.0
+
+
+def test_login_returns_retry_after_when_rate_limited(client, monkeypatch):
+    register(client)
+    monkeypatch.setattr(
+        server.login_admission, "email_limiter", server.TokenBucketLimiter(rate_per_minute=2, burst=1)
+    )
+    credentials = {"email": EMAIL, "password": "secret-password"}
+
+    assert client.post("/api/auth/login", json=credentials).status_code == 200
+    response = client.post("/api/auth/login", json=credentials)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "30"
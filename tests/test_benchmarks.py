@@ -0,0 +1,142 @@
+"""Microbenchmarks for the backend's per-request hot paths.
+
+Needs pytest-benchmark (in backend/requirements.txt); save a run with
+--benchmark-autosave and compare against it with --benchmark-compare.
+
+    python -m pytest tests/test_benchmarks.py --benchmark-autosave
+"""
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+from fastapi.security import HTTPAuthorizationCredentials
+
+import server
+from manage import sample_task_docs
+from storage import MemoryStorage, SQLiteStorage, TaskQuery, task_filter, task_sort_spec
+
+USER = {
+    "email": "bench@example.com",
+    "name": "Bench User",
+    "password": server.get_password_hash("bench-password"),
+    "created_at": "2024-01-01T00:00:00+00:00",
+    "token_version": 0,
+}
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def memory_storage(monkeypatch, loop):
+    storage = MemoryStorage()
+    loop.run_until_complete(storage.create_user(USER))
+    monkeypatch.setattr(server, "storage", storage)
+    server.user_cache.clear()
+    server.token_versions.clear()
+    yield storage
+    server.user_cache.clear()
+    server.token_versions.clear()
+
+
+def access_token() -> str:
+    return server.create_access_token(
+        server.user_token_claims(USER), timedelta(minutes=server.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+
+
+# ---- auth ----
+def test_create_access_token(benchmark):
+    token = benchmark(access_token)
+    assert token.count(".") == 2
+
+
+def test_get_current_user_cached(benchmark, memory_storage, loop):
+    """JWT decode plus the token_version check, answered from the cache."""
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=access_token())
+    loop.run_until_complete(server.get_current_user(credentials))
+
+    user = benchmark(lambda: loop.run_until_complete(server.get_current_user(credentials)))
+    assert user["email"] == USER["email"]
+
+
+def test_get_current_user_cold(benchmark, memory_storage, loop):
+    """As above, but every call misses the token_version cache and loads the user."""
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=access_token())
+
+    def authenticate():
+        server.token_versions.clear()
+        server.user_cache.clear()
+        return loop.run_until_complete(server.get_current_user(credentials))
+
+    assert benchmark(authenticate)["email"] == USER["email"]
+
+
+def test_get_password_hash(benchmark):
+    hashed = benchmark(server.get_password_hash, "bench-password")
+    assert hashed.startswith("$2")
+
+
+def test_verify_password(benchmark):
+    assert benchmark(server.verify_password, "bench-password", USER["password"])
+
+
+# ---- task serialisation ----
+@pytest.mark.parametrize("size", [1_000, 10_000])
+def test_task_model_construction(benchmark, size):
+    docs = sample_task_docs(size)
+    tasks = benchmark(lambda: [server.Task(**doc) for doc in docs])
+    assert len(tasks) == size
+
+
+@pytest.mark.parametrize("mode", ["trusted", "validated"])
+@pytest.mark.parametrize("size", [1_000, 10_000])
+def test_encode_task_list(benchmark, monkeypatch, mode, size):
+    monkeypatch.setattr(server, "TASK_LIST_SERIALIZATION", mode)
+    docs = sample_task_docs(size)
+    assert benchmark(server.encode_task_list, docs).startswith(b"[{")
+
+
+# ---- get_tasks query building ----
+def build_task_query(cursor: str) -> TaskQuery:
+    query, _ = server.build_task_query(
+        USER["email"],
+        status="pending",
+        priority="high",
+        limit=50,
+        cursor=cursor,
+        created_after=server.EPOCH,
+    )
+    return query
+
+
+def test_get_tasks_query_mongo(benchmark):
+    cursor = server.encode_task_cursor(sample_task_docs(1)[0])
+
+    def mongo_query():
+        query = build_task_query(cursor)
+        return task_filter(query), task_sort_spec(query.sort)
+
+    selector, sort = benchmark(mongo_query)
+    assert selector["user_email"] == USER["email"]
+    assert "$or" in selector
+
+
+def test_get_tasks_query_sqlite(benchmark, tmp_path):
+    cursor = server.encode_task_cursor(sample_task_docs(1)[0])
+    storage = SQLiteStorage(str(tmp_path / "bench.db"))
+    sql, params = benchmark(lambda: storage._select(build_task_query(cursor)))
+    assert sql.startswith("SELECT")
+    assert params[0] == USER["email"]
+
+
+def test_get_tasks_search_query(benchmark):
+    query, words = benchmark(server.build_task_query, USER["email"], search="quarterly report draft")
+    assert words == ["quarterly", "report", "draft"]
+    assert query.terms == words
@@ -0,0 +1,85 @@
+"""The /metrics exposition, on the in-memory backend."""
+from tests.conftest import register
+
+
+def metric(body: str, series: str) -> float:
+    for line in body.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{series} not in /metrics")
+
+
+def test_cache_stats_are_exported(client):
+    headers = register(client)
+    client.get("/api/auth/profile", headers=headers)
+    client.get("/api/auth/profile", headers=headers)
+
+    body = client.get("/metrics").text
+    assert metric(body, 'cache_hits_total{cache="token_version"}') >= 1
+    assert metric(body, 'cache_size{cache="token_version"}') == 1
+    for name in ("cache_misses_total", "cache_evictions_total"):
+        metric(body, name + '{cache="user"}')
+
+
+def test_password_hasher_stats_are_exported(client):
+    register(client)
+
+    body = client.get("/metrics").text
+    assert metric(body, 'password_hash_duration_seconds_count{op="hash"}') >= 1
+    assert metric(body, "password_hash_in_flight") == 0
+    assert metric(body, "password_hash_queue_depth") == 0
+    metric(body, "password_hash_rejected_total")
+
+
+def test_login_admission_stats_are_exported(client, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server.login_admission, "shed", {"ip_rate": 2, "email_rate": 1, "concurrency": 0})
+
+    body = client.get("/metrics").text
+    assert metric(body, "login_hashes_shed_total") == 3
+    assert metric(body, 'login_shed_total{reason="ip_rate"}') == 2
+    assert metric(body, 'login_shed_total{reason="concurrency"}') == 0
+
+
+def test_streaming_routes_are_timed_to_response_start():
+    import asyncio
+
+    import server
+
+    metrics = server.HTTPMetrics([0.1, 1.0])
+    observed = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        observed.append((dict(metrics.in_flight), sum(map(sum, metrics.histograms.values()))))
+        await asyncio.sleep(0.01)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    middleware = server.HTTPMetricsMiddleware(
+        app, metrics, server.app.router.routes, streaming_routes=server.STREAMING_ROUTES
+    )
+
+    async def get(path):
+        scope = {"type": "http", "method": "GET", "path": path, "root_path": "", "query_string": b"", "headers": []}
+
+        async def send(message):
+            pass
+
+        await middleware(scope, None, send)
+
+    asyncio.run(get("/api/tasks/events"))
+    asyncio.run(get("/api/tasks/stats"))
+
+    events, stats = ("GET", "/api/tasks/events"), ("GET", "/api/tasks/stats")
+    # Once the stream has started it is counted and no longer in flight
+    assert observed[0] == ({events: 0}, 1)
+    # Other routes are in flight until the body is sent
+    assert observed[1] == ({events: 0, stats: 1}, 1)
+    assert sum(metrics.histograms[stats + ("200",)]) == 1
+
+
+def test_cors_exposes_timing_headers(client):
+    response = client.get("/metrics", headers={"Origin": "http://localhost:3000"})
+    exposed = {name.strip() for name in response.headers["Access-Control-Expose-Headers"].split(",")}
+    assert {"Server-Timing", "X-Profile-File", "ETag"} <= exposed
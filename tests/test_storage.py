@@ -0,0 +1,445 @@
+"""Contract tests every storage backend must pass.
+
+The Mongo backend runs only when TEST_MONGO_URL points at a server; each run
+uses a throwaway database.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from pymongo import monitoring
+
+from storage import TASK_CONFLICT, MemoryStorage, MongoMonitor, MongoStorage, SQLiteStorage, TaskQuery, as_utc
+
+EMAIL = "owner@example.com"
+OTHER = "other@example.com"
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(params=["memory", "sqlite", "mongo"])
+async def storage(request, tmp_path):
+    if request.param == "memory":
+        backend = MemoryStorage()
+    elif request.param == "sqlite":
+        backend = SQLiteStorage(str(tmp_path / "taskflow.db"))
+    else:
+        url = os.getenv("TEST_MONGO_URL")
+        if not url:
+            pytest.skip("TEST_MONGO_URL is not set")
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        client = AsyncIOMotorClient(url, uuidRepresentation="standard")
+        backend = MongoStorage(client, f"taskflow_test_{uuid.uuid4().hex[:8]}")
+    await backend.ensure_indexes()
+    yield backend
+    if request.param == "mongo":
+        await backend.client.drop_database(backend.db.name)
+    await backend.close()
+
+
+def make_task(minutes, email=EMAIL, **fields):
+    at = T0 + timedelta(minutes=minutes)
+    return {
+        "_id": uuid.uuid4(),
+        "title": f"Task {minutes}",
+        "description": None,
+        "status": "todo",
+        "priority": "medium",
+        "user_email": email,
+        "created_at": at,
+        "updated_at": at,
+        "revision": 0,
+        "search_terms": [],
+        **fields,
+    }
+
+
+def ids(tasks):
+    return [task["_id"] for task in tasks]
+
+
+@pytest.mark.anyio
+async def test_ping_and_stats(storage):
+    await storage.ping()
+    assert storage.stats()["backend"] == type(storage).__name__
+
+
+def test_mongo_monitor_tracks_pool_and_commands():
+    monitor = MongoMonitor(max_pool_size=2)
+    address = ("db", 27017)
+    monitor.connection_created(monitoring.ConnectionCreatedEvent(address, 1))
+    monitor.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+    monitor.connection_checked_out(monitoring.ConnectionCheckedOutEvent(address, 1))
+    assert monitor.saturation() == 0.5
+    monitor.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+    monitor.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(address, "timeout"))
+    monitor.connection_checked_in(monitoring.ConnectionCheckedInEvent(address, 1))
+    monitor.succeeded(monitoring.CommandSucceededEvent(timedelta(microseconds=1500), {"ok": 1}, "find", 1, address, 0))
+
+    stats = monitor.stats()
+    assert (stats["connections"], stats["checked_out"], stats["max_checked_out"], stats["waiting"]) == (1, 0, 1, 0)
+    assert (stats["checkout"]["count"], stats["checkout"]["failures"]) == (2, 1)
+    assert stats["checkout_failures"] == {"timeout": 1}
+    assert stats["commands"]["find"]["count"] == 1
+    assert stats["commands"]["find"]["total_seconds"] == pytest.approx(0.0015)
+
+
+# ---- users ----
+@pytest.mark.anyio
+async def test_create_user_rejects_duplicate_email(storage):
+    user = {"email": EMAIL, "name": "Owner", "password": "hash", "created_at": T0.isoformat(), "token_version": 0}
+    assert await storage.create_user(user)
+    assert not await storage.create_user({**user, "name": "Impostor"})
+    assert (await storage.get_user(EMAIL))["name"] == "Owner"
+
+
+@pytest.mark.anyio
+async def test_get_user_hides_password_unless_asked(storage):
+    await storage.create_user(
+        {"email": EMAIL, "name": "Owner", "password": "hash", "created_at": T0.isoformat(), "token_version": 0}
+    )
+    assert "password" not in await storage.get_user(EMAIL)
+    assert (await storage.get_user(EMAIL, include_password=True))["password"] == "hash"
+    assert await storage.get_user(OTHER) is None
+
+
+@pytest.mark.anyio
+async def test_update_user_bumps_token_version(storage):
+    await storage.create_user(
+        {"email": EMAIL, "name": "Owner", "password": "hash", "created_at": T0.isoformat(), "token_version": 0}
+    )
+    updated = await storage.update_user(EMAIL, {"name": "Renamed"})
+    assert updated["name"] == "Renamed"
+    assert updated["token_version"] == 1
+    assert "password" not in updated
+    assert await storage.update_user(OTHER, {"name": "Nobody"}) is None
+
+
+# ---- revoked tokens ----
+@pytest.mark.anyio
+async def test_revoked_tokens(storage):
+    # Mongo's TTL index drops expired entries, so these must not have expired yet
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    assert await storage.revoke_token("old", expires_at=now + timedelta(hours=1), revoked_at=now)
+    assert await storage.revoke_token("new", expires_at=now + timedelta(hours=3), revoked_at=now + timedelta(hours=2))
+    # Revoking again is reported, so a refresh token can be rotated only once
+    assert not await storage.revoke_token("new", expires_at=now + timedelta(hours=9), revoked_at=now + timedelta(hours=9))
+
+    assert await storage.is_token_revoked("old")
+    assert not await storage.is_token_revoked("never")
+    assert sorted(await storage.revoked_token_ids()) == ["new", "old"]
+    assert await storage.revoked_token_ids(revoked_since=now + timedelta(hours=1)) == ["new"]
+    assert await storage.revoked_token_ids(expires_after=now + timedelta(hours=2)) == ["new"]
+
+
+# ---- tasks ----
+@pytest.mark.anyio
+async def test_insert_and_get_task(storage):
+    task = make_task(0, description="details")
+    await storage.insert_task(task)
+
+    stored = await storage.get_task(EMAIL, task["_id"])
+    assert stored["_id"] == task["_id"]
+    assert stored["title"] == "Task 0"
+    assert stored["description"] == "details"
+    assert as_utc(stored["created_at"]) == T0
+    assert "search_terms" not in stored
+
+    assert await storage.get_task(OTHER, task["_id"]) is None
+    assert await storage.get_task(EMAIL, uuid.uuid4()) is None
+    assert await storage.get_task(EMAIL, None) is None
+
+
+@pytest.mark.anyio
+async def test_get_task_limits_fields(storage):
+    task = make_task(0)
+    await storage.insert_task(task)
+    assert await storage.get_task(EMAIL, task["_id"], fields=()) == {"_id": task["_id"]}
+    assert await storage.get_task(EMAIL, task["_id"], fields=("title", "revision")) == {
+        "_id": task["_id"], "title": "Task 0", "revision": 0,
+    }
+
+
+@pytest.mark.anyio
+async def test_insert_tasks_reports_duplicates(storage):
+    first, second, third = make_task(0), make_task(1), make_task(2)
+    await storage.insert_task(first)
+
+    errors = await storage.insert_tasks([second, first, third], ordered=False)
+    assert list(errors) == [1]
+    assert await storage.get_task(EMAIL, third["_id"]) is not None
+
+    fourth, fifth = make_task(3), make_task(4)
+    errors = await storage.insert_tasks([fourth, first, fifth], ordered=True)
+    assert list(errors) == [1]
+    assert await storage.get_task(EMAIL, fourth["_id"]) is not None
+    assert await storage.get_task(EMAIL, fifth["_id"]) is None
+
+
+@pytest.mark.anyio
+async def test_find_tasks_only_returns_owned_tasks(storage):
+    mine, theirs = make_task(0), make_task(1, email=OTHER)
+    await storage.insert_tasks([mine, theirs])
+    found = await storage.find_tasks(EMAIL, [mine["_id"], theirs["_id"], uuid.uuid4()], fields=("status",))
+    assert found == [{"_id": mine["_id"], "status": "todo"}]
+    assert await storage.find_tasks(EMAIL, []) == []
+
+
+@pytest.mark.anyio
+async def test_list_tasks_sorts_and_pages(storage):
+    tasks = [make_task(minutes) for minutes in (3, 1, 4, 2)]
+    # Same updated_at: _id breaks the tie
+    tasks.append(make_task(4))
+    await storage.insert_tasks(tasks + [make_task(5, email=OTHER)])
+
+    newest_first = sorted(tasks, key=lambda task: (task["updated_at"], task["_id"]), reverse=True)
+    assert ids(await storage.list_tasks(TaskQuery(user_email=EMAIL))) == ids(newest_first)
+    assert ids(await storage.list_tasks(TaskQuery(user_email=EMAIL, sort="created_at"))) == ids(newest_first[::-1])
+
+    page = await storage.list_tasks(TaskQuery(user_email=EMAIL, limit=2))
+    assert ids(page) == ids(newest_first[:2])
+    last = page[-1]
+    rest = await storage.list_tasks(TaskQuery(user_email=EMAIL, after=(last["updated_at"], last["_id"])))
+    assert ids(rest) == ids(newest_first[2:])
+
+    last = newest_first[-2]
+    rest = await storage.list_tasks(TaskQuery(user_email=EMAIL, sort="updated_at", after=(last["updated_at"], last["_id"])))
+    assert ids(rest) == ids(newest_first[:-2][::-1])
+
+
+@pytest.mark.anyio
+async def test_list_tasks_filters(storage):
+    done = make_task(0, status="done", priority="high", search_terms=["ship", "shipping", "release"])
+    todo = make_task(10, search_terms=["ship", "docs"])
+    later = make_task(20, priority="high")
+    await storage.insert_tasks([done, todo, later])
+
+    def listed(**filters):
+        return storage.list_tasks(TaskQuery(user_email=EMAIL, **filters))
+
+    assert ids(await listed(status="done")) == [done["_id"]]
+    assert ids(await listed(priority="high")) == [later["_id"], done["_id"]]
+    assert ids(await listed(terms=["ship"])) == [todo["_id"], done["_id"]]
+    assert ids(await listed(terms=["ship", "release"])) == [done["_id"]]
+    assert ids(await listed(terms=["missing"])) == []
+    assert ids(await listed(created_after=T0 + timedelta(minutes=10))) == [later["_id"], todo["_id"]]
+    assert ids(await listed(updated_before=T0 + timedelta(minutes=10))) == [done["_id"]]
+    assert ids(await listed(
+        created_after=T0 + timedelta(minutes=5), created_before=T0 + timedelta(minutes=20)
+    )) == [todo["_id"]]
+
+
+@pytest.mark.anyio
+async def test_iter_tasks_yields_every_task_in_order(storage):
+    tasks = [make_task(minutes) for minutes in range(7)]
+    await storage.insert_tasks(tasks)
+    streamed = [task async for task in storage.iter_tasks(EMAIL, batch_size=3)]
+    assert ids(streamed) == ids(tasks[::-1])
+
+
+@pytest.mark.anyio
+async def test_update_task_checks_revision(storage):
+    task = make_task(0)
+    await storage.insert_task(task)
+    later = T0 + timedelta(hours=1)
+
+    before = await storage.update_task(EMAIL, task["_id"], {"title": "Renamed", "updated_at": later})
+    assert before["title"] == "Task 0"
+    assert before["revision"] == 0
+
+    assert await storage.update_task(EMAIL, task["_id"], {"title": "Stale"}, revisions=[0]) is None
+    assert await storage.update_task(EMAIL, task["_id"], {"status": "done"}, revisions=[1, 5]) is not None
+    assert await storage.update_task(OTHER, task["_id"], {"title": "Not yours"}) is None
+    assert await storage.update_task(EMAIL, None, {"title": "Nothing"}) is None
+
+    stored = await storage.get_task(EMAIL, task["_id"])
+    assert (stored["title"], stored["status"], stored["revision"]) == ("Renamed", "done", 2)
+    assert as_utc(stored["updated_at"]) == later
+
+
+@pytest.mark.anyio
+async def test_update_task_replaces_search_terms(storage):
+    task = make_task(0, search_terms=["old"])
+    await storage.insert_task(task)
+    await storage.update_task(EMAIL, task["_id"], {"title": "new", "search_terms": ["new"]})
+    assert ids(await storage.list_tasks(TaskQuery(user_email=EMAIL, terms=["new"]))) == [task["_id"]]
+    assert await storage.list_tasks(TaskQuery(user_email=EMAIL, terms=["old"])) == []
+
+
+@pytest.mark.anyio
+async def test_update_tasks(storage):
+    first, second = make_task(0), make_task(1)
+    await storage.insert_tasks([first, second])
+    errors = await storage.update_tasks(
+        EMAIL, [(first["_id"], {"status": "done"}, 0), (second["_id"], {"priority": "low"}, 0)]
+    )
+    assert errors == {}
+    stored = {task["_id"]: task for task in await storage.find_tasks(EMAIL, ids([first, second]))}
+    assert stored[first["_id"]]["status"] == "done"
+    assert stored[second["_id"]]["priority"] == "low"
+    assert stored[first["_id"]]["revision"] == stored[second["_id"]]["revision"] == 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("ordered", [True, False])
+async def test_update_tasks_only_at_the_expected_revision(storage, ordered):
+    first, second, third = make_task(0), make_task(1), make_task(2)
+    await storage.insert_tasks([first, second, third])
+    # Someone else wrote the first task after our read at revision 0
+    await storage.update_task(EMAIL, first["_id"], {"status": "theirs"})
+
+    errors = await storage.update_tasks(EMAIL, [
+        (first["_id"], {"status": "ours"}, 0),
+        (second["_id"], {"status": "a"}, 0),
+        # Chained on the failed update, so it conflicts too
+        (first["_id"], {"priority": "ours"}, 1),
+        (second["_id"], {"status": "b"}, 1),
+        (third["_id"], {"status": "c"}, 5),
+    ], ordered=ordered)
+
+    assert errors == {0: TASK_CONFLICT, 2: TASK_CONFLICT, 4: TASK_CONFLICT}
+    stored = {task["_id"]: task for task in await storage.find_tasks(EMAIL, ids([first, second, third]))}
+    assert (stored[first["_id"]]["status"], stored[first["_id"]]["revision"]) == ("theirs", 1)
+    assert (stored[second["_id"]]["status"], stored[second["_id"]]["revision"]) == ("b", 2)
+    assert stored[third["_id"]]["revision"] == 0
+
+
+@pytest.mark.anyio
+async def test_overlapping_deletes_report_each_task_once(storage):
+    tasks = [make_task(i) for i in range(4)]
+    await storage.insert_tasks(tasks)
+    task_ids = ids(tasks)
+
+    first, second = await asyncio.gather(
+        storage.delete_tasks(EMAIL, task_ids[:3]), storage.delete_tasks(EMAIL, task_ids[1:])
+    )
+
+    assert sorted(ids(first) + ids(second)) == sorted(task_ids)
+    assert await storage.list_tasks(TaskQuery(user_email=EMAIL)) == []
+
+
+@pytest.mark.anyio
+async def test_delete_tasks_return_what_they_removed(storage):
+    first, second, theirs = make_task(0), make_task(1), make_task(2, email=OTHER)
+    await storage.insert_tasks([first, second, theirs])
+
+    assert (await storage.delete_task(EMAIL, first["_id"]))["_id"] == first["_id"]
+    assert await storage.delete_task(EMAIL, first["_id"]) is None
+    assert await storage.delete_task(EMAIL, None) is None
+
+    deleted = await storage.delete_tasks(EMAIL, [second["_id"], theirs["_id"], first["_id"]])
+    assert ids(deleted) == [second["_id"]]
+    assert await storage.list_tasks(TaskQuery(user_email=EMAIL)) == []
+    assert await storage.get_task(OTHER, theirs["_id"]) is not None
+
+
+@pytest.mark.anyio
+async def test_count_tasks_and_owners(storage):
+    await storage.insert_tasks([
+        make_task(0, status="done", priority="high"),
+        make_task(1, status="done"),
+        make_task(2),
+        make_task(3, email=OTHER),
+    ])
+    assert await storage.count_tasks(EMAIL) == ({"done": 2, "todo": 1}, {"high": 1, "medium": 2})
+    assert await storage.count_tasks("nobody@example.com") == ({}, {})
+    assert await storage.task_owners() == [OTHER, EMAIL]
+
+
+# ---- counters and change log ----
+@pytest.mark.anyio
+async def test_record_write_numbers_changes_by_version(storage):
+    assert await storage.get_version(EMAIL) == 0
+    assert await storage.get_counters(EMAIL) is None
+
+    first = await storage.record_write(EMAIL, {"status": {"todo": 1}, "priority": {"low": 1}}, ["a"], [], T0)
+    second = await storage.record_write(EMAIL, {"status": {"todo": -1, "done": 1}}, ["a"], [], T0)
+    third = await storage.record_write(EMAIL, {"status": {"done": -1}, "priority": {"low": -1}}, [], ["a"], T0)
+    assert (first["seq"], second["seq"], third["seq"]) == (1, 2, 3)
+    assert await storage.get_version(EMAIL) == 3
+    assert await storage.get_version(OTHER) == 0
+
+    counters = await storage.get_counters(EMAIL)
+    assert counters["version"] == 3
+    assert counters["status"] == {}
+    assert counters["priority"] == {}
+    assert counters["reconciled_at"] is None
+    assert counters["changes_floor"] == 0
+
+    changes = await storage.list_changes(EMAIL, since=1, limit=10)
+    assert [(entry["seq"], entry["upserted"], entry["deleted"]) for entry in changes] == [(2, ["a"], []), (3, [], ["a"])]
+    assert as_utc(changes[0]["at"]) == T0
+    assert [entry["seq"] for entry in await storage.list_changes(EMAIL, since=0, limit=2)] == [1, 2]
+
+
+@pytest.mark.anyio
+async def test_set_counts_marks_counters_reconciled(storage):
+    await storage.record_write(EMAIL, {"status": {"todo": 5}}, [], [], T0)
+    assert await storage.set_counts(EMAIL, {"todo": 2, "in_progress": 1}, {"high": 3}, T0, version=1)
+    counters = await storage.get_counters(EMAIL)
+    assert counters["status"] == {"todo": 2, "in_progress": 1}
+    assert counters["priority"] == {"high": 3}
+    assert as_utc(counters["reconciled_at"]) == T0
+    assert counters["version"] == 1
+
+    await storage.record_write(EMAIL, {"status": {"todo": 1}}, [], [], T0)
+    assert (await storage.get_counters(EMAIL))["status"] == {"todo": 3, "in_progress": 1}
+
+
+@pytest.mark.anyio
+async def test_set_counts_only_at_the_expected_version(storage):
+    # No counters yet reads as version 0
+    assert not await storage.set_counts(EMAIL, {"todo": 1}, {}, T0, version=1)
+    assert await storage.get_counters(EMAIL) is None
+    assert await storage.set_counts(EMAIL, {"todo": 1}, {}, T0, version=0)
+
+    await storage.record_write(EMAIL, {"status": {"todo": 1}}, [], [], T0)
+    assert not await storage.set_counts(EMAIL, {"todo": 5}, {}, T0 + timedelta(hours=1), version=0)
+    counters = await storage.get_counters(EMAIL)
+    assert counters["status"] == {"todo": 2}
+    assert as_utc(counters["reconciled_at"]) == T0
+
+
+@pytest.mark.anyio
+async def test_counter_values_may_contain_dots_and_dollars(storage):
+    await storage.record_write(EMAIL, {"status": {"v1.2": 1, "$odd": 1}}, [], [], T0)
+    assert (await storage.get_counters(EMAIL))["status"] == {"v1.2": 1, "$odd": 1}
+
+
+@pytest.mark.anyio
+async def test_prune_changes_raises_floor(storage):
+    for minutes in range(3):
+        await storage.record_write(EMAIL, {}, ["a"], [], T0 + timedelta(minutes=minutes))
+    await storage.record_write(OTHER, {}, ["b"], [], T0 + timedelta(minutes=10))
+
+    assert await storage.prune_changes(T0 + timedelta(minutes=2)) == (2, 1)
+    assert (await storage.get_counters(EMAIL))["changes_floor"] == 2
+    assert (await storage.get_counters(OTHER))["changes_floor"] == 0
+    assert [entry["seq"] for entry in await storage.list_changes(EMAIL, since=0, limit=10)] == [3]
+    assert await storage.prune_changes(T0) == (0, 0)
+
+
+# ---- the interface itself ----
+def test_incomplete_backend_fails_at_construction():
+    from storage import Storage
+
+    class NoTasks(Storage):
+        async def ensure_indexes(self):
+            return {}
+
+    with pytest.raises(TypeError, match="abstract"):
+        NoTasks()
+
+
+def test_only_mongo_can_watch_changes(tmp_path):
+    assert MongoStorage.can_watch_changes
+    assert not MemoryStorage().can_watch_changes
+    assert not SQLiteStorage(str(tmp_path / "watch.db")).can_watch_changes
@@ -0,0 +1,421 @@
+"""Task endpoints and their helpers, on the in-memory backend."""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import server
+from tests.conftest import register
+
+
+def create(client, headers, **fields) -> dict:
+    response = client.post("/api/tasks", json={"title": "Task", **fields}, headers=headers)
+    assert response.status_code == 200, response.text
+    # Timestamps are kept to the millisecond; keep the updated_at order unambiguous
+    time.sleep(0.002)
+    return response.json()
+
+
+# ---- conditional updates ----
+def update(client, headers, task_id, if_match=None, **fields):
+    if if_match is not None:
+        headers = {**headers, "If-Match": if_match}
+    return client.put(f"/api/tasks/{task_id}", json=fields, headers=headers)
+
+
+def test_update_returns_the_new_etag(client):
+    headers = register(client)
+    task = create(client, headers)
+    assert client.get(f"/api/tasks/{task['id']}", headers=headers).headers["ETag"] == '"1"'
+
+    response = update(client, headers, task["id"], if_match='"1"', status="completed")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"2"'
+    assert client.get(f"/api/tasks/{task['id']}", headers=headers).headers["ETag"] == '"2"'
+
+
+def test_update_with_stale_etag_fails(client):
+    headers = register(client)
+    task = create(client, headers)
+    update(client, headers, task["id"], title="Changed")
+
+    for if_match in ('"1"', 'W/"1"', '"1", "7"'):
+        response = update(client, headers, task["id"], if_match=if_match, description="Stale")
+        assert response.status_code == 412, if_match
+    assert update(client, headers, task["id"], if_match='"7", "2"', description="Fresh").status_code == 200
+
+
+def test_update_with_wildcard_or_unparseable_etag(client):
+    headers = register(client)
+    task = create(client, headers)
+
+    assert update(client, headers, task["id"], if_match="*", status="completed").status_code == 200
+    assert update(client, headers, task["id"], if_match='"abc"', status="pending").status_code == 412
+    assert update(client, headers, task["id"], if_match="*", status="pending").status_code == 200
+
+
+def test_update_missing_task_is_404_even_with_if_match(client):
+    headers = register(client)
+    missing = str(uuid.uuid4())
+
+    assert update(client, headers, missing, status="completed").status_code == 404
+    assert update(client, headers, missing, if_match='"1"', status="completed").status_code == 404
+
+
+def test_task_without_revision_counts_as_zero(client):
+    headers = register(client)
+    task = create(client, headers)
+    stored = server.storage.tasks["owner@example.com"][uuid.UUID(task["id"])]
+    del stored["revision"]
+
+    assert client.get(f"/api/tasks/{task['id']}", headers=headers).headers["ETag"] == '"0"'
+    assert update(client, headers, task["id"], if_match='"1"', title="Stale").status_code == 412
+    response = update(client, headers, task["id"], if_match='"0"', title="Renamed")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"1"'
+
+
+def test_partial_text_update_that_keeps_losing_races_is_409(client, monkeypatch):
+    headers = register(client)
+    task = create(client, headers)
+
+    async def always_raced(email, task_id, update_data, revisions):
+        return None
+
+    monkeypatch.setattr(server.storage, "update_task", always_raced)
+    response = update(client, headers, task["id"], title="Renamed")
+    assert response.status_code == 409
+
+
+# ---- search ----
+def test_build_search_terms_indexes_every_prefix_once():
+    assert server.build_search_terms("Fix bug", "bug fix") == ["f", "fi", "fix", "b", "bu", "bug"]
+    assert server.build_search_terms(None, None) == []
+
+
+def test_build_search_terms_is_capped(monkeypatch):
+    monkeypatch.setattr(server, "SEARCH_MAX_PREFIX", 4)
+    assert server.build_search_terms("Refactoring", None) == ["r", "re", "ref", "refa"]
+
+    monkeypatch.setattr(server, "SEARCH_MAX_TERMS", 3)
+    assert server.build_search_terms("alpha beta", None) == ["a", "al", "alp"]
+
+
+def test_search_score_prefers_whole_words_and_titles():
+    task = {"title": "Write report", "description": "quarterly numbers"}
+
+    assert server.search_score(task, ["report"]) == 4
+    assert server.search_score(task, ["rep"]) == 2
+    assert server.search_score(task, ["numbers"]) == 2
+    assert server.search_score(task, ["num"]) == 1
+    assert server.search_score(task, ["report", "num"]) == 5
+    assert server.search_score(task, ["missing"]) == 0
+    assert server.search_score({"title": "Report", "description": None}, ["report"]) == 4
+
+
+def test_search_ranks_matches(client):
+    headers = register(client)
+    create(client, headers, title="Notes", description="report draft")
+    create(client, headers, title="Report", description="final")
+    create(client, headers, title="Reporting tool")
+    create(client, headers, title="Unrelated")
+
+    titles = [task["title"] for task in client.get("/api/tasks?search=report", headers=headers).json()]
+    assert titles == ["Report", "Reporting tool", "Notes"]
+
+
+def test_search_ranks_only_the_window(client, monkeypatch):
+    headers = register(client)
+    create(client, headers, title="Report")
+    create(client, headers, title="Notes", description="report")
+    create(client, headers, title="Notes", description="reporting")
+    monkeypatch.setattr(server, "SEARCH_RANK_WINDOW", 2)
+
+    # The exact title match is the least recently updated, outside the window
+    tasks = client.get("/api/tasks?search=report&limit=1", headers=headers).json()
+    assert [task["description"] for task in tasks] == ["report"]
+
+
+def test_search_rejects_cursor(client):
+    headers = register(client)
+    response = client.get("/api/tasks?search=report&cursor=abc", headers=headers)
+    assert response.status_code == 400
+
+
+# ---- bulk operations ----
+def stats(client, headers) -> dict:
+    return client.get("/api/tasks/stats", headers=headers).json()
+
+
+def counted_owner(client) -> dict:
+    """Register and reconcile once, so later stats come from the counters, not a recount."""
+    headers = register(client)
+    stats(client, headers)
+    return headers
+
+
+def test_stats_reconcile_keeps_a_write_made_while_counting(client, monkeypatch):
+    email = "owner@example.com"
+    headers = register(client, email)
+    create(client, headers)
+    original_count_tasks = server.storage.count_tasks
+    raced = []
+
+    async def count_then_write(email):
+        counted = await original_count_tasks(email)
+        if not raced:
+            raced.append(True)
+            task = server.new_task_doc(server.TaskCreate(title="Raced"), email)
+            await server.storage.insert_task(task)
+            await server.record_task_write(
+                email, {"status": {"pending": 1}, "priority": {"medium": 1}}, upserted=[str(task["_id"])]
+            )
+        return counted
+
+    monkeypatch.setattr(server.storage, "count_tasks", count_then_write)
+    assert stats(client, headers)["by_status"]["pending"] == 2
+    monkeypatch.setattr(server.storage, "count_tasks", original_count_tasks)
+    assert stats(client, headers)["by_status"]["pending"] == 2
+
+
+def test_stats_reconcile_gives_up_when_tasks_keep_changing(client, monkeypatch):
+    email = "owner@example.com"
+    headers = register(client, email)
+    task_id = create(client, headers)["id"]
+    original_count_tasks = server.storage.count_tasks
+
+    async def count_then_write(email):
+        counted = await original_count_tasks(email)
+        await server.record_task_write(email, {}, upserted=[task_id])
+        return counted
+
+    monkeypatch.setattr(server.storage, "count_tasks", count_then_write)
+    result = asyncio.run(server.reconcile_task_counters(email))
+    assert result["reconciled"] is False
+    assert asyncio.run(server.storage.get_counters(email))["reconciled_at"] is None
+
+
+def bulk_update(client, headers, updates, ordered=True) -> dict:
+    response = client.put("/api/tasks/bulk", json={"updates": updates, "ordered": ordered}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def statuses(result: dict) -> list:
+    return [item["status"] for item in result["results"]]
+
+
+def test_bulk_create_reports_each_item(client):
+    headers = counted_owner(client)
+    response = client.post(
+        "/api/tasks/bulk",
+        json={"tasks": [{"title": "One"}, {"title": "Two", "status": "completed"}]},
+        headers=headers,
+    )
+
+    assert response.status_code == 200
+    assert statuses(response.json()) == ["created", "created"]
+    assert response.json()["succeeded"] == 2
+    assert stats(client, headers)["by_status"] == {"pending": 1, "in-progress": 0, "completed": 1}
+
+
+def test_bulk_update_ordered_stops_at_not_found(client):
+    headers = counted_owner(client)
+    first, second = create(client, headers), create(client, headers)
+    missing = "00000000-0000-4000-8000-000000000000"
+
+    result = bulk_update(client, headers, [
+        {"id": first["id"], "status": "completed"},
+        {"id": missing, "status": "completed"},
+        {"id": second["id"], "status": "completed"},
+    ])
+
+    assert statuses(result) == ["updated", "not_found", "skipped"]
+    assert (result["succeeded"], result["failed"]) == (1, 2)
+    assert stats(client, headers)["by_status"]["completed"] == 1
+
+
+def test_bulk_update_unordered_continues_past_not_found(client):
+    headers = counted_owner(client)
+    first, second = create(client, headers), create(client, headers)
+
+    result = bulk_update(client, headers, [
+        {"id": first["id"], "status": "completed"},
+        {"id": "not-a-task-id", "status": "completed"},
+        {"id": second["id"], "status": "completed"},
+    ], ordered=False)
+
+    assert statuses(result) == ["updated", "not_found", "updated"]
+    assert stats(client, headers)["by_status"] == {"pending": 0, "in-progress": 0, "completed": 2}
+
+
+def test_bulk_update_applies_duplicate_ids_in_order(client):
+    headers = counted_owner(client)
+    task = create(client, headers)
+
+    result = bulk_update(client, headers, [
+        {"id": task["id"], "status": "in-progress"},
+        {"id": task["id"], "status": "completed", "priority": "high"},
+    ])
+
+    assert statuses(result) == ["updated", "updated"]
+    stored = client.get(f"/api/tasks/{task['id']}", headers=headers).json()
+    assert (stored["status"], stored["priority"]) == ("completed", "high")
+    counts = stats(client, headers)
+    assert counts["by_status"] == {"pending": 0, "in-progress": 0, "completed": 1}
+    assert counts["by_priority"] == {"low": 0, "medium": 0, "high": 1}
+
+
+def test_bulk_update_counts_only_applied_writes(client, monkeypatch):
+    headers = counted_owner(client)
+    first, second = create(client, headers), create(client, headers)
+
+    async def first_write_fails(email, updates, ordered=True):
+        await original_update_tasks(email, updates[1:], ordered)
+        return {0: "disk full"}
+
+    original_update_tasks = server.storage.update_tasks
+    monkeypatch.setattr(server.storage, "update_tasks", first_write_fails)
+    result = bulk_update(client, headers, [
+        {"id": first["id"], "status": "completed"},
+        {"id": second["id"], "status": "in-progress"},
+    ], ordered=False)
+
+    assert statuses(result) == ["error", "updated"]
+    assert stats(client, headers)["by_status"] == {"pending": 1, "in-progress": 1, "completed": 0}
+
+
+def write_between_read_and_update(monkeypatch, task_id: str, changes: dict, counter_changes: dict):
+    """Land a single-task update right after bulk_update_tasks has read the tasks."""
+    original_find_tasks = server.storage.find_tasks
+
+    async def find_then_write(email, task_ids, fields=None):
+        found = await original_find_tasks(email, task_ids, fields)
+        await server.storage.update_task(email, uuid.UUID(task_id), changes)
+        await server.record_task_write(email, counter_changes, upserted=[task_id])
+        return found
+
+    monkeypatch.setattr(server.storage, "find_tasks", find_then_write)
+
+
+def test_bulk_update_conflicts_with_a_write_after_its_read(client, monkeypatch):
+    headers = counted_owner(client)
+    raced = create(client, headers, title="Old title", description="Old notes")
+    other = create(client, headers)
+    write_between_read_and_update(
+        monkeypatch, raced["id"],
+        {
+            "description": "New notes",
+            "status": "completed",
+            "search_terms": server.build_search_terms("Old title", "New notes"),
+        },
+        {"status": {"pending": -1, "completed": 1}},
+    )
+
+    result = bulk_update(client, headers, [
+        {"id": raced["id"], "title": "New title", "status": "in-progress"},
+        {"id": raced["id"], "priority": "high"},
+        {"id": other["id"], "status": "in-progress"},
+    ], ordered=False)
+
+    assert statuses(result) == ["conflict", "conflict", "updated"]
+    assert result["results"][0]["error"] == server.TASK_CONFLICT
+    stored = client.get(f"/api/tasks/{raced['id']}", headers=headers).json()
+    assert (stored["title"], stored["description"], stored["status"]) == ("Old title", "New notes", "completed")
+    # Search terms still describe the stored text, not the stale read
+    assert client.get("/api/tasks?search=new", headers=headers).json()[0]["id"] == raced["id"]
+    assert stats(client, headers)["by_status"] == {"pending": 0, "in-progress": 1, "completed": 1}
+    # The change log entry for the bulk write names only the task it changed
+    assert server.storage.changes["owner@example.com"][-1]["upserted"] == [other["id"]]
+
+
+def test_bulk_update_ordered_error_skips_the_rest(client, monkeypatch):
+    headers = counted_owner(client)
+    first, second = create(client, headers), create(client, headers)
+
+    async def first_write_fails(email, updates, ordered=True):
+        return {0: "disk full", 1: server.TASK_SKIPPED}
+
+    monkeypatch.setattr(server.storage, "update_tasks", first_write_fails)
+    result = bulk_update(client, headers, [
+        {"id": first["id"], "status": "completed"},
+        {"id": second["id"], "status": "completed"},
+    ])
+
+    assert statuses(result) == ["error", "skipped"]
+    assert stats(client, headers)["by_status"] == {"pending": 2, "in-progress": 0, "completed": 0}
+
+
+def test_bulk_delete_reports_missing_ids(client):
+    headers = counted_owner(client)
+    task = create(client, headers, status="completed")
+
+    response = client.request(
+        "DELETE", "/api/tasks/bulk", json={"ids": [task["id"], task["id"], "missing"]}, headers=headers
+    )
+
+    assert statuses(response.json()) == ["deleted", "not_found", "not_found"]
+    assert stats(client, headers)["total"] == 0
+
+
+# ---- events ----
+def test_changestream_broker_needs_mongo():
+    env = {**os.environ, "STORAGE_BACKEND": "memory", "TASK_EVENTS_BROKER": "changestream"}
+    result = subprocess.run(
+        [sys.executable, "-c", "import server"],
+        cwd=Path(server.__file__).parent, env=env, capture_output=True, text=True,
+    )
+    assert result.returncode != 0
+    assert "TASK_EVENTS_BROKER=changestream needs STORAGE_BACKEND=mongo" in result.stderr
+
+
+def test_write_succeeds_when_publishing_its_event_fails(client, monkeypatch):
+    headers = register(client)
+
+    async def broken_publish(email, entry):
+        raise RuntimeError("broker unavailable")
+
+    monkeypatch.setattr(server.task_events, "publish", broken_publish)
+    queue = server.task_events.subscribe("owner@example.com")
+    try:
+        response = client.post("/api/tasks", json={"title": "Saved anyway"}, headers=headers)
+    finally:
+        server.task_events.unsubscribe("owner@example.com", queue)
+
+    assert response.status_code == 200
+    assert queue.get_nowait() == {"type": "resync", "since": None}
+    assert [task["title"] for task in client.get("/api/tasks", headers=headers).json()] == ["Saved anyway"]
+def test_change_stream_resumes_and_resyncs_when_it_cannot(monkeypatch):
+    from pymongo.errors import OperationFailure
+
+    broker = server.ChangeStreamTaskEventBroker(10)
+    broker.retry_seconds = 0
+    queue = broker.subscribe("owner@example.com")
+    calls = []
+
+    async def watch_changes(resume_after=None):
+        calls.append(resume_after)
+        if len(calls) == 1:
+            yield None, "opened"
+            yield {"user_email": "nobody@example.com", "seq": 1}, "after-1"
+            raise ConnectionError("primary stepped down")
+        if len(calls) == 2:
+            raise OperationFailure("resume point is no longer in the oplog", code=286)
+        yield None, "reopened"
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(server.storage, "watch_changes", watch_changes)
+
+    async def run():
+        await broker.start()
+        while queue.empty():
+            await asyncio.sleep(0)
+        await broker.stop()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    # Reconnected from the last change seen, then from scratch once that failed
+    assert calls == [None, "after-1", None]
+    assert queue.get_nowait() == {"type": "resync", "since": None}